@@ -0,0 +1,110 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from extraction_cache import CACHE_DIR
+
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 5000))
+
+
+class SemanticAnswerCache:
+    # Answers keyed by the exact set of indexed documents plus a question embedding;
+    # a lookup hits when a stored question is within the cosine threshold
+    def __init__(self, path=None, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "answers.sqlite3")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY, doc_set TEXT, question TEXT, embedding BLOB,
+                answer TEXT, created REAL, last_access REAL, individual INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS answers_doc_set ON answers (doc_set);
+        """)
+        # Caches created before single-pass answers were told apart; their rows are left unknown (NULL)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(answers)")}
+        if "individual" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE answers ADD COLUMN individual INTEGER")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+        self._conn.commit()
+
+    def lookup(self, doc_set, embedding, require_individual=False):
+        # require_individual skips answers stored without per-document responses, so they
+        # neither count as hits nor hide a usable answer to a similar question
+        query = np.array(embedding, dtype="float32")
+        query /= np.linalg.norm(query) or 1.0
+        sql = "SELECT id, embedding, answer FROM answers WHERE doc_set = ? AND created >= ?"
+        if require_individual:
+            sql += " AND individual = 1"
+        with self._lock:
+            rows = self._conn.execute(sql, (doc_set, time.time() - self.ttl)).fetchall()
+            best_id, best_answer, best_score = None, None, self.threshold
+            for row_id, blob, answer in rows:
+                vector = np.frombuffer(blob, dtype="float32")
+                score = float(vector @ query) / (float(np.linalg.norm(vector)) or 1.0)
+                if score >= best_score:
+                    best_id, best_answer, best_score = row_id, answer, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (time.time(), best_id))
+            self._conn.commit()
+        return json.loads(best_answer)
+
+    def store(self, doc_set, question, embedding, answer, individual=True):
+        # individual=False marks an answer without per-document responses (a single-pass summary)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (doc_set, question, embedding, answer, created, last_access, individual) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_set, question, np.asarray(embedding, dtype="float32").tobytes(), json.dumps(answer), now, now,
+                 int(individual)),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN "
+                "(SELECT id FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_cache = None
+
+
+def get_answer_cache():
+    global _cache
+    if _cache is None:
+        _cache = SemanticAnswerCache()
+    return _cache
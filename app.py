@@ -1,17 +1,29 @@
+import os
+import time
+
 import streamlit as st
-from comparison import compare_responses_via_api
-from lib import *
-from brain import get_index_for_pdf
+from comparison import compare_responses_via_api, comparison_key
+from config import get_openai_api_key
 from document_handler import initialize_session_state, handle_file_uploads
-import pandas as pd
-import os
-from openai import OpenAI
+from answer_cache import get_answer_cache
+from context_packer import context_report, retrieve_packed
+from llm_executor import get_executor
+from tokenizer import count_tokens
+from tracing import METRICS_PORT, get_tracer, span, start_metrics_server
 
-# Set the API key as an environment variable
-os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
+# Heavy dependencies (LangChain, FAISS, PyMuPDF, Tesseract, the OpenAI SDK) are imported by the
+# stage that first needs them; benchmarks/bench_startup.py keeps this import cheap
 
-# Initialize the OpenAI client
-client = OpenAI()
+# Shared, rate-limited executor for chat completions
+executor = get_executor()
+
+# Summarized answers come from one streamed completion over every document's context while the
+# contexts fit in this many tokens; beyond it, each document is answered first and the answers merged
+SUMMARY_SINGLE_PASS_TOKENS = int(os.environ.get("SUMMARY_SINGLE_PASS_TOKENS", 12000))
+
+# Prometheus scrape endpoint for the stage timings, when a port is configured
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
 
 # Set the title for the Streamlit app
 st.title("RAG-OCR Enhanced Chatbot")
@@ -43,37 +55,49 @@ def display_chat_history():
             with st.chat_message(message["role"]):
                 st.write(message["content"])
 
-def perform_similarity_search(vectordbs, question):
-    pdf_extracts = []
-    for vectordb in vectordbs:
-        search_results = vectordb.similarity_search(question, k=10)
-        pdf_extracts.append("\n".join([result.page_content for result in search_results]))
-    return pdf_extracts
+def perform_similarity_search(vectordb, question, query_vector=None, lexical_only=False):
+    # One index search for every document, then overlap removal, MMR and a token budget per document
+    packed = retrieve_packed(vectordb, question, query_vector, lexical_only=lexical_only)
+    pdf_extracts = [context.text for context in packed]
+    return pdf_extracts, context_report(packed)
 
 def generate_initial_responses(pdf_extracts, question, document_names):
-    combined_responses = []
-    for extract, doc_name in zip(pdf_extracts, document_names):
+    requests = []
+    for extract in pdf_extracts:
         individual_prompt = prompt_template.format(pdf_extract=extract)
-        try:
-            completion = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": individual_prompt},
-                    {"role": "user", "content": question}
-                ],
-                temperature=0.2
-            )
-            response = completion.choices[0].message.content
-            # Check for empty or unrelated responses and apply fallback
-            if not response.strip() or "Did not get any Related Information" in response:
-                response = "Sorry, I didn’t understand your question. Do you want to connect with a live agent?"
-            combined_responses.append((doc_name, response.strip()))
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
-    return combined_responses
+        requests.append({
+            "model": "gpt-3.5-turbo",
+            "messages": [
+                {"role": "system", "content": individual_prompt},
+                {"role": "user", "content": question}
+            ],
+            "temperature": 0.2
+        })
 
+    # All documents are asked concurrently; results come back in document order. Also returns
+    # the positions of the documents whose request failed, whose entries only describe the error
+    combined_responses = []
+    failed = set()
+    for i, (doc_name, completion) in enumerate(zip(document_names, executor.map_chat(requests))):
+        if isinstance(completion, Exception):
+            st.error(f"An error occurred for \"{doc_name}\": {completion}")
+            combined_responses.append((doc_name, f"An error occurred: {completion}"))
+            failed.add(i)
+            continue
+        response = completion.choices[0].message.content
+        # Check for empty or unrelated responses and apply fallback
+        if not response.strip() or "Did not get any Related Information" in response:
+            response = "Sorry, I didn’t understand your question. Do you want to connect with a live agent?"
+        combined_responses.append((doc_name, response.strip()))
+    return combined_responses, failed
 
-def refine_combined_response(combined_response_text, question):
+
+def combine_responses(responses, failed):
+    # The answers that go into refinement; failed documents are left out
+    return "\n\n".join(response for i, (_, response) in enumerate(responses) if i not in failed)
+
+
+def refine_request(combined_response_text, question):
     formatted_prompt = f"""
     I have gathered the following information from multiple sources in response to the question: "{question}"
 
@@ -81,62 +105,211 @@ def refine_combined_response(combined_response_text, question):
 
     Please refine and improve the answer by making it more coherent and comprehensive and please do not repeat anything and output it in proper order.
     """
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "user", "content": formatted_prompt}],
+        "temperature": 0
+    }
+
+
+def refine_combined_response(combined_response_text, question):
     try:
-        refinement = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": formatted_prompt}],
-            temperature=0
-        )
+        refinement = executor.chat(**refine_request(combined_response_text, question))
         final_response = refinement.choices[0].message.content
     except Exception as e:
         st.error(f"An error occurred during refinement: {e}")
         final_response = ""
     return final_response.strip()
 
+
+def summary_request(pdf_extracts, question, document_names):
+    # Every document's context in one prompt, labelled so the answer can tell them apart
+    extracts = "\n\n".join(f'Document "{name}":\n{extract}' for name, extract in zip(document_names, pdf_extracts))
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": prompt_template.format(pdf_extract=extracts)},
+            {"role": "user", "content": question}
+        ],
+        "temperature": 0.2
+    }
+
+
+def summary_strategy(context_tokens, question):
+    tokens = context_tokens["packed_tokens"] + count_tokens(prompt_template) + count_tokens(question)
+    return "single_pass" if tokens <= SUMMARY_SINGLE_PASS_TOKENS else "map_reduce"
+
+
+def stream_summary(pdf_extracts, question, document_names, strategy, stats):
+    # Yields the Summarized answer as it streams. stats receives the per-document answers and
+    # the failed positions (map_reduce only), the time to first token and the total, both from
+    # the start of answering
+    start = time.perf_counter()
+    with span(f"summarize_{strategy}", documents=len(document_names)) as summary_span:
+        if strategy == "single_pass":
+            stats["individual_responses"], stats["failed"] = None, set()
+            request = summary_request(pdf_extracts, question, document_names)
+        else:
+            responses, failed = generate_initial_responses(pdf_extracts, question, document_names)
+            stats["individual_responses"], stats["failed"] = responses, failed
+            if len(failed) == len(responses):
+                raise RuntimeError("no document could be answered")
+            request = refine_request(combine_responses(responses, failed), question)
+        for text in executor.stream_chat(**request):
+            if "ttft_seconds" not in stats:
+                stats["ttft_seconds"] = time.perf_counter() - start
+            yield text
+        stats["seconds"] = time.perf_counter() - start
+        summary_span.set(ttft_seconds=stats.get("ttft_seconds", stats["seconds"]))
+
+
+def timing_caption(timing):
+    return (f"{timing['strategy'].replace('_', ' ')} · first token {timing['ttft_seconds']:.2f}s · "
+            f"{timing['seconds']:.2f}s total")
+
+
+def display_response(question, entry):
+    with st.chat_message("user"):
+        st.write(question)
+
+    if entry["display_mode"] == "Document-wise":
+        for doc_name, response in entry["individual_responses"]:
+            with st.chat_message("assistant"):
+                st.write(f"Response from the Document \"{doc_name}\" :")
+                st.write(response)
+    elif entry["display_mode"] == "Summarized":
+        with st.chat_message("assistant"):
+            st.write(entry["combined_response"])
+            timing = entry.get("timing")
+            if timing:
+                st.caption(timing_caption(timing))
+    elif entry["display_mode"] == "Comparison":
+        comparison_result = entry["comparison"]
+        with st.chat_message("assistant"):
+            import pandas as pd
+            pd.set_option('display.max_colwidth', None)
+            st.table(comparison_result)
+
+def display_trace_panel():
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return
+    import pandas as pd
+
+    with st.sidebar.expander("Performance trace"):
+        stages = tracer.summary()
+        if not stages:
+            st.write("No timings recorded yet.")
+            return
+        last_question = tracer.last_trace("question")
+        if last_question:
+            st.write("Last question")
+            st.dataframe(pd.DataFrame(last_question).drop(columns=["trace", "started"]))
+        st.write("All stages")
+        st.dataframe(pd.DataFrame(stages).fillna(0))
+        st.download_button("Download spans (JSON lines)", tracer.to_jsonl(), file_name="spans.jsonl")
+
 def handle_user_input(question, display_mode):
     vectordbs = st.session_state.get("vectordbs", None)
     document_names = st.session_state.get("document_names", [])
     if "responses" not in st.session_state:
         st.session_state["responses"] = {}
+    if "comparisons" not in st.session_state:
+        st.session_state["comparisons"] = {}
 
     if not vectordbs:
         with st.chat_message("assistant"):
             st.write("You need to provide a PDF")
             st.stop()
 
-    pdf_extracts = perform_similarity_search(vectordbs, question)
-    new_responses = generate_initial_responses(pdf_extracts, question, document_names)
+    # Earlier answers render first; a repeated question moves to the end with its new answer
+    st.session_state["responses"].pop(question, None)
+    for q, entry in st.session_state["responses"].items():
+        display_response(q, entry)
 
-    combined_response_text = "\n\n".join([response for _, response in new_responses])
-    final_result = refine_combined_response(combined_response_text, question)
+    from embeddings import embed_question
 
-    # Store individual and combined responses in session state
-    response_entry = {
-        "question": question,
-        "individual_responses": new_responses,
-        "combined_response": final_result,
-        "display_mode": display_mode
-    }
-    st.session_state["responses"][question] = response_entry
-
-    # Display responses based on their associated display mode
-    for q, entry in st.session_state["responses"].items():
-        with st.chat_message("user"):
-            st.write(q)
-
-        if entry["display_mode"] == "Document-wise":
-            for doc_name, response in entry["individual_responses"]:
-                with st.chat_message("assistant"):
-                    st.write(f"Response from the Document \"{doc_name}\" :")
-                    st.write(response)
-        elif entry["display_mode"] == "Summarized":
+    streamed = False
+    with span("question", display_mode=display_mode, documents=len(document_names)):
+        # Near-identical questions over the same documents reuse an earlier answer. The question is
+        # embedded once for the cache and retrieval; if that fails or is slow, retrieval is lexical only
+        answer_cache = get_answer_cache()
+        with span("answer_cache_lookup") as lookup_span:
+            question_vector = embed_question(vectordbs.embedder, question)
+            cached = None
+            if question_vector is not None:
+                # Single-pass summaries have no per-document answers to show in the other modes
+                cached = answer_cache.lookup(vectordbs.fingerprint(), question_vector,
+                                             require_individual=display_mode != "Summarized")
+            lookup_span.set(cache_hits=int(cached is not None), cache_misses=int(cached is None))
+        context_tokens = None
+        timing = None
+        if cached is not None:
+            new_responses = cached["individual_responses"]
+            if new_responses is not None:
+                new_responses = [tuple(response) for response in new_responses]
+            final_result = cached["combined_response"]
+        elif display_mode == "Summarized":
+            pdf_extracts, context_tokens = perform_similarity_search(vectordbs, question, question_vector,
+                                                                  lexical_only=question_vector is None)
+            timing = {"strategy": summary_strategy(context_tokens, question)}
+            stats = {}
+            with st.chat_message("user"):
+                st.write(question)
             with st.chat_message("assistant"):
-                st.write(entry["combined_response"])
-        elif entry["display_mode"] == "Comparison":
-            comparison_result = compare_responses_via_api(question, vectordbs, document_names)
-            with st.chat_message("assistant"):
-                pd.set_option('display.max_colwidth', None)
-                st.table(comparison_result)
+                try:
+                    final_result = st.write_stream(
+                        stream_summary(pdf_extracts, question, document_names, timing["strategy"], stats))
+                except Exception as e:
+                    st.error(f"An error occurred while summarizing: {e}")
+                    final_result = ""
+                if "seconds" in stats:
+                    timing.update(ttft_seconds=stats.get("ttft_seconds", stats["seconds"]), seconds=stats["seconds"])
+                    st.caption(timing_caption(timing))
+                else:
+                    timing = None
+            streamed = True
+            new_responses = stats.get("individual_responses")
+            failed = stats.get("failed")
+            if final_result and not failed and question_vector is not None:
+                answer_cache.store(vectordbs.fingerprint(), question, question_vector, {
+                    "individual_responses": new_responses,
+                    "combined_response": final_result,
+                }, individual=new_responses is not None)
+        else:
+            pdf_extracts, context_tokens = perform_similarity_search(vectordbs, question, question_vector,
+                                                                  lexical_only=question_vector is None)
+            new_responses, failed = generate_initial_responses(pdf_extracts, question, document_names)
+            final_result = ""
+            if len(failed) < len(new_responses):
+                final_result = refine_combined_response(combine_responses(new_responses, failed), question)
+
+            if final_result and not failed and question_vector is not None:
+                answer_cache.store(vectordbs.fingerprint(), question, question_vector, {
+                    "individual_responses": new_responses,
+                    "combined_response": final_result,
+                })
+
+        # Store individual and combined responses in session state
+        response_entry = {
+            "question": question,
+            "individual_responses": new_responses,
+            "combined_response": final_result,
+            "display_mode": display_mode,
+            "context_tokens": context_tokens,
+            "timing": timing
+        }
+        if display_mode == "Comparison":
+            # Computed once per question and document set; reruns render the stored table
+            key = comparison_key(question, vectordbs)
+            if key not in st.session_state["comparisons"]:
+                st.session_state["comparisons"][key] = compare_responses_via_api(
+                    question, vectordbs, document_names, question_vector, lexical_only=question_vector is None)
+            response_entry["comparison"] = st.session_state["comparisons"][key]
+        st.session_state["responses"][question] = response_entry
+
+    if not streamed:
+        display_response(question, response_entry)
 
 
 # Initialize session state variables if not already done
@@ -150,6 +323,8 @@ if 'display_mode' not in st.session_state:
     st.session_state.display_mode = "Document-wise"
 
 def main():
+    # Read here rather than at import; the environment takes precedence over Streamlit secrets
+    get_openai_api_key()
     initialize_session_state()
     initialize_prompt()
     handle_file_uploads()
@@ -164,6 +339,8 @@ def main():
     if question:
         handle_user_input(question, display_mode)
 
+    display_trace_panel()
+
 if __name__ == "__main__":
     main()
 
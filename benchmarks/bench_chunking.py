@@ -0,0 +1,91 @@
+# Per-page RecursiveCharacterTextSplitter (the old text_to_docs) vs. the shared TokenChunker.
+#
+#   python -m benchmarks.bench_chunking --pages 2000
+#
+# Reports pages/sec and chunks/sec, plus the spread of chunk sizes in tokens,
+# which is what drives prompt size predictability.
+import argparse
+import json
+import statistics
+import time
+
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from chunking import ChunkDocuments, TokenChunker
+from tokenizer import count_tokens
+
+SENTENCE = ("Net revenue for fiscal {year} reached {amount} million, while operating margin "
+            "moved to {margin} percent and free cash flow covered the dividend {cover} times. ")
+
+
+def make_pages(count):
+    return [
+        "".join(SENTENCE.format(year=2015 + i % 9, amount=120 + i, margin=8 + i % 20, cover=1 + i % 4)
+                for _ in range(20))
+        for i in range(count)
+    ]
+
+
+def legacy_text_to_docs(text, filename):
+    page_docs = [Document(page_content=page) for page in text]
+    for i, doc in enumerate(page_docs):
+        doc.metadata["page"] = i + 1
+    doc_chunks = []
+    for doc in page_docs:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
+            chunk_overlap=200,
+        )
+        chunks = text_splitter.split_text(doc.page_content)
+        for i, chunk in enumerate(chunks):
+            doc = Document(page_content=chunk, metadata={"page": doc.metadata["page"], "chunk": i})
+            doc.metadata["source"] = f"{doc.metadata['page']}-{doc.metadata['chunk']}"
+            doc.metadata["filename"] = filename
+            doc_chunks.append(doc)
+    return [doc.page_content for doc in doc_chunks]
+
+
+def token_chunker(pages, materialize):
+    records = list(TokenChunker().chunk_pages("bench", pages))
+    if materialize:
+        # What text_to_docs hands to the embedder: every chunk read once as a Document
+        return [doc.page_content for doc in ChunkDocuments(records, pages, "bench.pdf")]
+    return records
+
+
+def measure(name, pages, fn):
+    start = time.perf_counter()
+    chunks = fn()
+    elapsed = time.perf_counter() - start
+    texts = [chunk if isinstance(chunk, str) else chunk.text(pages) for chunk in chunks]
+    sizes = [count_tokens(text) for text in texts]
+    return {
+        "splitter": name,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) / elapsed, 1),
+        "chunks_per_sec": round(len(chunks) / elapsed, 1),
+        "chunks": len(chunks),
+        "tokens_min": min(sizes),
+        "tokens_max": max(sizes),
+        "tokens_stdev": round(statistics.pstdev(sizes), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    args = parser.parse_args()
+    pages = make_pages(args.pages)
+
+    results = [
+        measure("recursive_character (legacy)", pages, lambda: legacy_text_to_docs(pages, "bench.pdf")),
+        measure("token_chunker (records)", pages, lambda: token_chunker(pages, materialize=False)),
+        measure("token_chunker (materialized)", pages, lambda: token_chunker(pages, materialize=True)),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# Offline end-to-end benchmark: ingestion, retrieval, answering and comparison.
+#
+#   python -m benchmarks.bench_e2e --text-docs 4 --scanned-docs 2 --pages 20 --queries 20 --latency 0.3
+#   python -m benchmarks.bench_e2e --out results.json
+#   python -m benchmarks.bench_e2e --scanned-docs 0 --summaries 10 --token-latency 0.02
+#
+# Synthetic filings are generated in memory (scanned ones through
+# handling_images.save_images_to_pdf), embedded with the hash embedder and
+# answered by benchmarks.stub_openai, so nothing leaves the machine. The run
+# happens in a fresh process with an empty cache directory; scanned PDFs still
+# need tesseract, poppler and eng.traineddata like the app does, and that phase
+# is skipped when the binaries are missing.
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "What was the total revenue for the year?",
+    "How did net income change year over year?",
+    "Which segment drove EBITDA growth?",
+    "What is the debt-to-equity ratio?",
+    "Summarize free cash flow across the years.",
+    "What happened to operating margin?",
+    "Compare revenue in FY21 and FY23.",
+    "Which metric declined the most?",
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(p * len(values)))], 4)
+
+
+def latency_summary(values):
+    return {"count": len(values), "p50_seconds": percentile(values, 0.50), "p95_seconds": percentile(values, 0.95)}
+
+
+def _chunks(index):
+    return sum(document["end"] - document["start"] for document in index.documents.values())
+
+
+def _ingest(function, pdf_files, names, pages):
+    start = time.perf_counter()
+    index = function(pdf_files, names, "stub")
+    seconds = time.perf_counter() - start
+    chunks = _chunks(index)
+    return index, {
+        "documents": len(index),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(pages / seconds, 2),
+        "chunks_per_sec": round(chunks / seconds, 2),
+    }
+
+
+def _child(args):
+    from benchmarks.stub_openai import start_server
+
+    server, base_url = start_server(latency=args.latency, token_latency=args.token_latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    # Imported only now so module-level settings pick up the benchmark environment
+    import app
+    from brain import get_index_for_pdf
+    from brain_text import get_index_for_text_pdf
+    from comparison import compare_responses_via_api
+    from benchmarks.synthetic import make_scanned_pdf, make_text_pdf
+    from tracing import get_tracer
+
+    results = {"config": vars(args)}
+
+    text_files = [make_text_pdf(args.pages, seed) for seed in range(args.text_docs)]
+    index, results["ingest_text"] = _ingest(
+        get_index_for_text_pdf, text_files, [f"text_{seed}.pdf" for seed in range(args.text_docs)],
+        args.pages * args.text_docs,
+    )
+
+    if args.scanned_docs and not (shutil.which("tesseract") and shutil.which("pdftoppm")):
+        results["ingest_scanned"] = {"skipped": "tesseract or poppler is not installed"}
+    elif args.scanned_docs:
+        seeds = range(args.text_docs, args.text_docs + args.scanned_docs)
+        scanned_files = [make_scanned_pdf(args.pages, seed) for seed in seeds]
+        before = _chunks(index)
+        start = time.perf_counter()
+        index = get_index_for_pdf(scanned_files, [f"scanned_{seed}.pdf" for seed in seeds], "stub", index)
+        seconds = time.perf_counter() - start
+        pages = args.pages * args.scanned_docs
+        chunks = _chunks(index) - before
+        results["ingest_scanned"] = {
+            "documents": args.scanned_docs,
+            "pages": pages,
+            "chunks": chunks,
+            "seconds": round(seconds, 4),
+            "pages_per_sec": round(pages / seconds, 2),
+            "chunks_per_sec": round(chunks / seconds, 2),
+        }
+
+    document_names = index.document_names()
+    questions = [QUESTIONS[i % len(QUESTIONS)] + f" ({i})" for i in range(args.queries)]
+    retrieval, answering, comparing, context_tokens = [], [], [], 0
+    for i, question in enumerate(questions):
+        start = time.perf_counter()
+        pdf_extracts, report = app.perform_similarity_search(index, question)
+        retrieved = time.perf_counter()
+        responses, failed = app.generate_initial_responses(pdf_extracts, question, document_names)
+        app.refine_combined_response(app.combine_responses(responses, failed), question)
+        answered = time.perf_counter()
+        retrieval.append(retrieved - start)
+        answering.append(answered - start)
+        context_tokens += report["packed_tokens"]
+        if i < args.comparisons:
+            compare_responses_via_api(question, index, document_names)
+            comparing.append(time.perf_counter() - answered)
+
+    # Summarized mode: the old blocking map-reduce against both streamed strategies, timed from
+    # the end of retrieval; blocking answers arrive all at once, so their first token is the total
+    summaries = {"blocking_map_reduce": ([], []), "single_pass": ([], []), "map_reduce": ([], [])}
+    for question in questions[:args.summaries]:
+        pdf_extracts, _ = app.perform_similarity_search(index, question)
+        start = time.perf_counter()
+        responses, failed = app.generate_initial_responses(pdf_extracts, question, document_names)
+        app.refine_combined_response(app.combine_responses(responses, failed), question)
+        summaries["blocking_map_reduce"][0].append(time.perf_counter() - start)
+        summaries["blocking_map_reduce"][1].append(time.perf_counter() - start)
+        for strategy in ("single_pass", "map_reduce"):
+            stats = {}
+            "".join(app.stream_summary(pdf_extracts, question, document_names, strategy, stats))
+            summaries[strategy][0].append(stats["ttft_seconds"])
+            summaries[strategy][1].append(stats["seconds"])
+    results["summarized"] = {
+        strategy: {"ttft_p50_seconds": percentile(ttfts, 0.50), "total_p50_seconds": percentile(totals, 0.50)}
+        for strategy, (ttfts, totals) in summaries.items()
+    }
+
+    results["retrieval"] = latency_summary(retrieval)
+    results["query"] = dict(latency_summary(answering), context_tokens=context_tokens)
+    results["comparison"] = latency_summary(comparing)
+    results["llm_calls"] = app.executor.latency_summary()
+    results["stages"] = get_tracer().summary()
+    results["stub_requests"] = server.state.requests
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    # OCR and large text PDFs run in worker processes
+    results["peak_worker_rss_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    server.shutdown()
+    print(json.dumps(results))
+
+
+def _arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-docs", type=int, default=4)
+    parser.add_argument("--scanned-docs", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--comparisons", type=int, default=5, help="queries that also run the comparison table")
+    parser.add_argument("--summaries", type=int, default=5, help="queries that also time the Summarized strategies")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub chat completion latency in seconds")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="stub seconds per answer word")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    parser.add_argument("--child", action="store_true")
+    return parser
+
+
+def main():
+    parser = _arguments()
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # app.py reads the key from Streamlit secrets at import, so the child runs from a
+        # directory that has one
+        os.makedirs(os.path.join(work_dir, ".streamlit"))
+        with open(os.path.join(work_dir, ".streamlit", "secrets.toml"), "w") as f:
+            f.write('OPENAI_API_KEY = "stub"\n')
+        cache_dir = os.path.join(work_dir, "cache")
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])),
+            RAG_CACHE_DIR=cache_dir,
+            RAG_INDEX_DIR=os.path.join(cache_dir, "indexes"),
+            EMBEDDING_PROVIDER="hash",
+            OPENAI_API_KEY="stub",
+            # The stub has no quota; the default TPM budget would make later phases wait on earlier ones
+            LLM_TOKENS_PER_MINUTE=os.environ.get("LLM_TOKENS_PER_MINUTE", "10000000"),
+        )
+        cmd = [sys.executable, "-m", "benchmarks.bench_e2e", "--child", *sys.argv[1:]]
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True, env=env, cwd=work_dir).stdout
+        results = json.loads(out.strip().splitlines()[-1])
+
+    results["config"].pop("child", None)
+    results["config"].pop("out", None)
+    report = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Upstream load from concurrent sessions with and without the shared LLM executor.
+#
+#   python -m benchmarks.bench_gateway --sessions 8 --documents 4 --questions 3
+#   python -m benchmarks.bench_gateway --latency 0.3 --max-concurrent 6
+#
+# Each session embeds its question and asks it of every document, the way
+# handle_user_input does, against the local stub. Sessions draw questions from a
+# small shared set, as users of one deployment tend to. "per_session" is the old
+# pattern: a client per session, the SDK's own retries and an unbounded fan-out.
+# "gateway" sends everything through one LLMExecutor. The stub answers 429 once
+# more than --max-concurrent requests are in flight.
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_openai import start_server
+
+MODEL = "gpt-3.5-turbo"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def session_requests(question, documents):
+    return [{
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": f"Answer from document {i} of the annual report."},
+            {"role": "user", "content": question},
+        ],
+        "temperature": 0.2,
+    } for i in range(documents)]
+
+
+def per_session(question, documents, state):
+    from openai import OpenAI
+
+    client = OpenAI(api_key="stub")
+
+    def call(create, **kwargs):
+        try:
+            return create(**kwargs)
+        except Exception as e:
+            return e
+
+    results = [call(client.embeddings.create, model=EMBEDDING_MODEL, input=[question])]
+    with ThreadPoolExecutor() as pool:
+        results += pool.map(lambda request: call(client.chat.completions.create, **request),
+                            session_requests(question, documents))
+    state["errors"] += sum(1 for result in results if isinstance(result, Exception))
+
+
+def gateway(question, documents, state):
+    executor = state["executor"]
+    try:
+        executor.embed([question], EMBEDDING_MODEL)
+    except Exception:
+        state["errors"] += 1
+    results = executor.map_chat(session_requests(question, documents))
+    state["errors"] += sum(1 for result in results if isinstance(result, Exception))
+
+
+def run(mode, args):
+    from llm_executor import LLMExecutor
+
+    server, base_url = start_server(latency=args.latency, max_concurrent=args.max_concurrent)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "stub"
+    state = {"errors": 0, "executor": LLMExecutor(base_delay=0.05) if mode == "gateway" else None}
+    function = gateway if mode == "gateway" else per_session
+    rng = random.Random(args.seed)
+    questions = [f"What was the revenue growth in {2015 + i}?" for i in range(args.questions)]
+
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            function(rng.choice(questions), args.documents, state)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session) for _ in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    server.shutdown()
+
+    latencies.sort()
+    stub = server.state
+    result = {
+        "wall_seconds": round(wall, 3),
+        "question_p50_seconds": round(latencies[len(latencies) // 2], 3),
+        "question_p95_seconds": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        "upstream_requests": stub.requests,
+        "upstream_by_path": stub.paths,
+        "rate_limited": stub.throttled,
+        "connections": stub.connections,
+        "errors": state["errors"],
+    }
+    if state["executor"] is not None:
+        result["coalesced"] = state["executor"].latency_summary()["coalesced"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3, help="questions per session")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--questions", type=int, default=3, help="distinct questions shared by the sessions")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", default=["per_session", "gateway"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {"sessions": args.sessions, "documents": args.documents, "modes": {}}
+    for mode in args.modes:
+        results["modes"][mode] = run(mode, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
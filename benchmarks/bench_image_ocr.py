@@ -0,0 +1,98 @@
+# Time saved per image by OCR'ing uploads directly instead of via a PDF.
+#
+#   python -m benchmarks.bench_image_ocr photo1.jpg scan2.png
+#   python -m benchmarks.bench_image_ocr --synthetic 8 --size 3024x4032
+#   python -m benchmarks.bench_image_ocr --synthetic 8 --convert-only
+#
+# "via_pdf" is the old upload path: handling_images.save_images_to_pdf, then the
+# OCRPipeline rasterizing that PDF with poppler. "direct" hands the original
+# bytes to OCRPipeline.run_images. --convert-only skips Tesseract and times just
+# the image handling in front of it. Both paths run single-process and uncached.
+import argparse
+import io
+import json
+import os
+import time
+
+from PIL import Image
+
+
+class _Upload(io.BytesIO):
+    # What save_images_to_pdf expects from a Streamlit UploadedFile
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def synthetic_images(count, size):
+    from benchmarks.synthetic import make_page_image, page_text
+    import random
+
+    width, height = size
+    images = []
+    for seed in range(count):
+        page = make_page_image(page_text(random.Random(seed), "Contoso", seed + 1, sentences=12))
+        buffer = io.BytesIO()
+        # A phone photo of a page: large, colour, JPEG
+        page.convert("RGB").resize((width, height)).save(buffer, format="JPEG", quality=90)
+        images.append((f"synthetic_{seed}.jpg", buffer.getvalue()))
+    return images
+
+
+def via_pdf(name, data, pipeline, convert_only):
+    from pdf2image import convert_from_bytes
+    from handling_images import save_images_to_pdf
+
+    _, pdf_buffer = save_images_to_pdf([_Upload(data, name)])
+    if convert_only:
+        return convert_from_bytes(pdf_buffer.getvalue(), dpi=pipeline.dpi)
+    return pipeline.run(pdf_buffer.getvalue())
+
+
+def direct(name, data, pipeline, convert_only):
+    from ocr_pipeline import preprocess_image
+
+    if convert_only:
+        with Image.open(io.BytesIO(data)) as image:
+            return preprocess_image(image, pipeline.image_max_side, pipeline.image_grayscale,
+                                    pipeline.image_binarize)
+    return pipeline.run_images([data])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate this many page photos")
+    parser.add_argument("--size", default="3024x4032", help="synthetic image size, WIDTHxHEIGHT")
+    parser.add_argument("--convert-only", action="store_true", help="skip Tesseract")
+    parser.add_argument("--binarize", action="store_true")
+    args = parser.parse_args()
+
+    from ocr_pipeline import OCRPipeline
+
+    images = [(os.path.basename(path), open(path, "rb").read()) for path in args.images]
+    if args.synthetic:
+        images += synthetic_images(args.synthetic, tuple(int(side) for side in args.size.split("x")))
+    if not images:
+        parser.error("pass image files or --synthetic N")
+
+    pipeline = OCRPipeline(workers=1, image_binarize=args.binarize)
+    results = {"images": len(images), "convert_only": args.convert_only}
+    for mode, function in (("via_pdf", via_pdf), ("direct", direct)):
+        seconds = []
+        for name, data in images:
+            start = time.perf_counter()
+            function(name, data, pipeline, args.convert_only)
+            seconds.append(time.perf_counter() - start)
+        results[mode] = {
+            "seconds": round(sum(seconds), 4),
+            "seconds_per_image": round(sum(seconds) / len(seconds), 4),
+        }
+    results["saved_per_image"] = round(
+        results["via_pdf"]["seconds_per_image"] - results["direct"]["seconds_per_image"], 4)
+    results["speedup"] = round(results["via_pdf"]["seconds"] / max(results["direct"]["seconds"], 1e-9), 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
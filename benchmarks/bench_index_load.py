@@ -0,0 +1,67 @@
+# Cold vs. warm index loading for text PDFs.
+#
+#   python -m benchmarks.bench_index_load report1.pdf report2.pdf
+#
+# The cold run starts from an empty cache directory, so it extracts, chunks,
+# embeds and persists every document. The warm run is a fresh process pointed
+# at the same directory and only memory-maps what the cold run stored.
+# EMBEDDING_PROVIDER defaults to "hash" here so no network calls are made.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _child(paths):
+    from brain_text import get_index_for_text_pdf
+
+    pdf_files = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pdf_files.append(f.read())
+
+    start = time.perf_counter()
+    index = get_index_for_text_pdf(pdf_files, [os.path.basename(path) for path in paths], openai_api_key="unused")
+    elapsed = time.perf_counter() - start
+
+    search_start = time.perf_counter()
+    index.search("total revenue for the year", k=10)
+    search_elapsed = time.perf_counter() - search_start
+
+    print(json.dumps({
+        "documents": len(index),
+        "load_seconds": round(elapsed, 4),
+        "first_search_seconds": round(search_elapsed, 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--child", action="store_true")
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.pdfs)
+        return
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ, RAG_CACHE_DIR=cache_dir, RAG_INDEX_DIR=os.path.join(cache_dir, "indexes"))
+        env.setdefault("EMBEDDING_PROVIDER", "hash")
+        env.setdefault("OPENAI_API_KEY", "unused")
+        results = {}
+        for phase in ("cold", "warm"):
+            cmd = [sys.executable, "-m", "benchmarks.bench_index_load", "--child", *args.pdfs]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+            results[phase] = json.loads(out.strip().splitlines()[-1])
+    results["speedup"] = round(results["cold"]["load_seconds"] / max(results["warm"]["load_seconds"], 1e-9), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
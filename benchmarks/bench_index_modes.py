@@ -0,0 +1,87 @@
+# Recall@k, query latency and memory of each vector index backend against exact search.
+#
+#   python -m benchmarks.bench_index_modes --vectors 50000 --dim 1536 --k 10
+#   INDEX_NPROBE=32 python -m benchmarks.bench_index_modes --backends ivf ivfpq
+#
+# Vectors are clustered Gaussian data added in document-sized batches, the way
+# DocumentIndex adds them, so the trained backends train at the same point they
+# would in the app. Queries are perturbed copies of stored vectors.
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from vector_index import BACKENDS, MmapFlatBackend, TrainedBackend
+
+
+def make_vectors(count, dimensions, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype("float32")
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(count, dimensions)).astype("float32")
+    # Unit length, like OpenAI embeddings
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def memory_bytes(backend):
+    if isinstance(backend, MmapFlatBackend):
+        return sum(vectors.nbytes + norms.nbytes for _, vectors, norms in backend._segments)
+    if isinstance(backend, TrainedBackend):
+        index = backend.index if backend.index is not None else backend.exact.index
+    else:
+        index = backend.index
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--document-size", type=int, default=500, help="vectors added per call")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, args.vectors, size=args.queries)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype("float32")
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = {"vectors": args.vectors, "dim": args.dim, "k": args.k, "backends": {}}
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = BACKENDS[name](args.dim)
+        for offset in range(0, args.vectors, args.document_size):
+            batch = vectors[offset:offset + args.document_size]
+            backend.add(np.arange(offset, offset + len(batch), dtype="int64"), batch)
+        build_seconds = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for row, query in enumerate(queries):
+            start = time.perf_counter()
+            _, ids = backend.search(query[None, :], args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(ids[0].tolist()) & set(truth[row].tolist()))
+        latencies.sort()
+        results["backends"][name] = {
+            "recall_at_k": round(hits / (args.queries * args.k), 4),
+            "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+            "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+            "memory_mb": round(memory_bytes(backend) / 2 ** 20, 2),
+            "build_seconds": round(build_seconds, 3),
+            "trained": getattr(backend, "index", True) is not None,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
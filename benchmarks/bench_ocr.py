@@ -0,0 +1,105 @@
+# Compare the legacy whole-document OCR path with the windowed OCRPipeline.
+#
+#   python -m benchmarks.bench_ocr scan.pdf --workers 4 --window-size 8
+#
+# Each mode runs in a fresh subprocess so peak RSS is measured in isolation.
+# "pipeline" routes pages with a usable text layer around Tesseract;
+# "pipeline_ocr_all" is the same pipeline with routing off.
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def run_legacy(pdf_bytes):
+    # The pre-pipeline brain.parse_pdf: rasterize everything, round-trip through JPEG on disk
+    import re
+    from pdf2image import convert_from_path
+    from PIL import Image
+    import pytesseract
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
+        temp_pdf.write(pdf_bytes)
+        temp_pdf_path = temp_pdf.name
+    images = convert_from_path(temp_pdf_path)
+    os.unlink(temp_pdf_path)
+
+    output = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for i, image in enumerate(images, start=1):
+            image_path = os.path.join(workdir, f"image_{i}.jpg")
+            image.save(image_path)
+            text = pytesseract.image_to_string(Image.open(image_path))
+            text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
+            text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
+            text = re.sub(r"\n\s*\n", "\n\n", text)
+            output.append(text)
+    return output
+
+
+def run_pipeline(pdf_bytes, workers, window_size, routing=True):
+    from ocr_pipeline import OCRPipeline
+
+    pipeline = OCRPipeline(workers=workers, window_size=window_size, routing=routing)
+    return pipeline.run(pdf_bytes), pipeline.last_stats
+
+
+def _child(args):
+    import brain  # noqa: F401  configures tesseract the same way the app does
+
+    with open(args.pdf, "rb") as f:
+        pdf_bytes = f.read()
+
+    start = time.perf_counter()
+    stats = {}
+    if args.mode == "legacy":
+        pages = run_legacy(pdf_bytes)
+    else:
+        pages, stats = run_pipeline(pdf_bytes, args.workers, args.window_size, args.mode == "pipeline")
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "mode": args.mode,
+        "pages": len(pages),
+        "text_pages": stats.get("text_pages", 0),
+        "ocr_pages": stats.get("ocr_pages", len(pages)),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(pages) / elapsed, 3) if elapsed else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--window-size", type=int, default=0)
+    parser.add_argument("--mode", choices=["legacy", "pipeline_ocr_all", "pipeline"])
+    args = parser.parse_args()
+
+    if args.mode:
+        _child(args)
+        return
+
+    results = []
+    for mode in ("legacy", "pipeline_ocr_all", "pipeline"):
+        cmd = [sys.executable, "-m", "benchmarks.bench_ocr", args.pdf, "--mode", mode,
+               "--workers", str(args.workers), "--window-size", str(args.window_size)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Hit rate and latency of vector, BM25 and hybrid retrieval, plus the query-embedding
+# cache and the lexical fast path.
+#
+#   python -m benchmarks.bench_retrieval --documents 8 --pages 20 --questions 50
+#   python -m benchmarks.bench_retrieval --slow-embedding 5 --timeout 0.5
+#
+# Synthetic filings get one "needle" line item per question planted on a random
+# page; a question hits when the needle's chunk is among the top k of its
+# document after fusing --fetch-k candidates per ranking. Vectors come from the offline hash embedder. The fast-path phase
+# wraps that embedder so every question takes --slow-embedding seconds to embed
+# and times retrieve_packed falling back to BM25 against waiting for the vector.
+import argparse
+import json
+import os
+import random
+import time
+
+from benchmarks.synthetic import COMPANIES, page_text
+
+SEGMENTS = ["Zephyr", "Quartz", "Halcyon", "Meridian", "Obsidian", "Lumen", "Cobalt", "Sable"]
+ITEMS = ["goodwill impairment", "deferred tax asset", "lease liability", "warranty reserve", "restructuring charge",
+         "inventory write-down", "litigation accrual", "capitalized software"]
+
+
+def make_corpus(documents, pages, questions, seed):
+    rng = random.Random(seed)
+    texts = [[page_text(rng, COMPANIES[d % len(COMPANIES)], page) for page in range(1, pages + 1)]
+             for d in range(documents)]
+    needles = []
+    for i in range(questions):
+        d, page = rng.randrange(documents), rng.randrange(pages)
+        item, segment = rng.choice(ITEMS), f"{rng.choice(SEGMENTS)}-{i}"
+        amount = f"{rng.randint(10, 990)}.{rng.randint(0, 9)}"
+        texts[d][page] += f"\nThe {item} recorded for the {segment} line was {amount} million."
+        needles.append((d, f"{segment} line was {amount}", f"What was the {item} for the {segment} line?"))
+    return texts, needles
+
+
+class SlowEmbeddings:
+    # The embedding service under load: every query waits before answering
+    def __init__(self, inner, delay):
+        self.inner = inner
+        self.delay = delay
+        self.model = inner.model
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        time.sleep(self.delay)
+        return self.inner.embed_query(text)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fetch-k", type=int, default=20, help="candidates per ranking, as CONTEXT_FETCH_K")
+    parser.add_argument("--slow-embedding", type=float, default=2.0, help="seconds per query embedding")
+    parser.add_argument("--timeout", type=float, default=0.5, help="QUERY_EMBED_TIMEOUT for the fast path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ["QUERY_EMBED_TIMEOUT"] = str(args.timeout)
+    from brain import text_to_docs
+    from context_packer import retrieve_packed
+    from embeddings import CachedEmbeddings, EmbeddingStore, HashEmbeddings
+    from vector_index import DocumentIndex
+
+    texts, needles = make_corpus(args.documents, args.pages, args.questions, args.seed)
+    embedder = CachedEmbeddings(HashEmbeddings(), "hash-256", store=EmbeddingStore(":memory:"))
+    index = DocumentIndex(embedder)
+    doc_ids = []
+    for d, pages in enumerate(texts):
+        doc_id = f"doc{d}"
+        docs = text_to_docs(pages, f"{doc_id}.pdf", doc_id)
+        index.add_document(doc_id, f"{doc_id}.pdf", docs, embedder.embed_documents([doc.page_content for doc in docs]))
+        doc_ids.append(doc_id)
+
+    results = {"documents": args.documents, "pages": args.pages, "questions": args.questions, "k": args.k,
+               "modes": {}}
+    for mode in ("vector", "lexical", "hybrid"):
+        hits, latencies = 0, []
+        for d, needle, question in needles:
+            query_vector = embedder.embed_query(question)
+            start = time.perf_counter()
+            ranked = index.hybrid_search(question, args.fetch_k, query_vector=query_vector, mode=mode)[doc_ids[d]]
+            latencies.append(time.perf_counter() - start)
+            hits += any(needle in doc.page_content for doc, _ in ranked[:args.k])
+        latencies.sort()
+        results["modes"][mode] = {
+            "hit_rate": round(hits / len(needles), 3),
+            "p50_ms": round(1000 * latencies[len(latencies) // 2], 3),
+            "p95_ms": round(1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 3),
+        }
+
+    # The app embeds each question for the answer cache, retrieval and the comparison table
+    before = dict(embedder.stats)
+    for _, _, question in needles:
+        for _ in range(3):
+            embedder.embed_query(question + " (again)")
+    results["query_embeddings"] = {
+        "lookups": embedder.stats["queries"] - before["queries"],
+        "embedded": (embedder.stats["queries"] - before["queries"])
+                    - (embedder.stats["queries_cached"] - before["queries_cached"]),
+    }
+
+    slow = DocumentIndex(CachedEmbeddings(SlowEmbeddings(HashEmbeddings(), args.slow_embedding), "hash-256-slow",
+                                          store=EmbeddingStore(":memory:")))
+    for doc_id in doc_ids:
+        entry = index.documents[doc_id]
+        slow.add_document(doc_id, entry["filename"], index._chunks[doc_id], index._vectors[doc_id])
+    d, needle, question = needles[0]
+    start = time.perf_counter()
+    packed = retrieve_packed(slow, question)
+    fallback_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    retrieve_packed(slow, question + " (blocking)", slow.embedder.embed_query(question + " (blocking)"))
+    results["fast_path"] = {
+        "embedding_seconds": args.slow_embedding,
+        "timeout_seconds": args.timeout,
+        "lexical_fallback_seconds": round(fallback_seconds, 3),
+        "blocking_seconds": round(time.perf_counter() - start, 3),
+        "hit": needle in packed[d].text,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
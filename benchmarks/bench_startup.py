@@ -0,0 +1,65 @@
+# Import-time budget for the app and the ingestion worker.
+#
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --budget 0.3 --runs 7
+#
+# Each module is imported in a fresh interpreter, a few times, and the median
+# cost on top of importing streamlit is compared with the budget. Importing a
+# module must also leave the heavy, stage-specific dependencies unloaded. Exits
+# non-zero when either check fails, so it can gate CI.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the stage that needs them, never by importing the app or a worker
+DEFERRED = ["faiss", "fitz", "pytesseract", "pdf2image", "reportlab", "PyPDF2", "langchain", "langchain_core",
+            "langchain_community", "langchain_openai", "openai", "tiktoken", "pandas"]
+
+_PROBE = """
+import json, sys, time
+import streamlit
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "loaded": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def measure(module, runs):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    env.setdefault("OPENAI_API_KEY", "unused")
+    samples, loaded = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _PROBE, module, *DEFERRED], check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return statistics.median(samples), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=["app", "ingest_worker"])
+    parser.add_argument("--budget", type=float, default=float(os.environ.get("STARTUP_BUDGET_SECONDS", 0.5)),
+                        help="seconds allowed per module on top of streamlit")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results, ok = {}, True
+    for module in args.modules:
+        seconds, loaded = measure(module, args.runs)
+        passed = seconds <= args.budget and not loaded
+        ok = ok and passed
+        results[module] = {"median_seconds": round(seconds, 4), "deferred_loaded": loaded, "passed": passed}
+    print(json.dumps({"budget_seconds": args.budget, "modules": results}, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Whole-document legacy extraction vs. the page-streaming extractor in brain_text.
+#
+#   python -m benchmarks.bench_text_extract --pages 1000 --workers 4
+#
+# A synthetic text PDF is generated with PyMuPDF unless --pdf is given.
+# Peak memory is the Python-heap peak reported by tracemalloc for each run.
+import argparse
+import json
+import os
+import re
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+PARAGRAPH = (
+    "Consolidated revenue for FY{year} was ${amount}.{cents} million, an increase of {pct}% "
+    "over the prior year. Operating ex-\npenses remained stable while EBITDA margin improved "
+    "to {margin}%. The board declared a dividend of ${dividend} per share.\n"
+)
+
+
+def make_pdf(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        text = "".join(PARAGRAPH.format(year=20 + i % 5, amount=100 + i, cents=i % 100, pct=i % 17,
+                                        margin=10 + i % 30, dividend=i % 9) for _ in range(6))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def legacy_extract(pdf_bytes):
+    # The pre-streaming brain_text.parse_pdf, kept verbatim for comparison
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    text_content = ""
+    for page_num in range(len(doc)):
+        page = doc.load_page(page_num)
+        text_content += page.get_text("text")
+    text = str({'text': text_content})
+    text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
+    text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
+    text = re.sub(r"\n\s*\n", "\n\n", text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\x20-\x7E]', '', text)
+    text = re.sub(r'(\D)(\d)', r'\1 \2', text)
+    text = re.sub(r'(\d)(\D)', r'\1 \2', text)
+    return [text]
+
+
+def measure(name, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    pages = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "extractor": name,
+        "seconds": round(elapsed, 3),
+        "pages_returned": len(pages),
+        "peak_python_heap_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--pdf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = make_pdf(args.pages)
+
+    from brain_text import extract_pages
+
+    results = [
+        measure("legacy", lambda: legacy_extract(pdf_bytes)),
+        measure("streaming", lambda: extract_pages(pdf_bytes, workers=1)),
+        measure(f"streaming x{args.workers}", lambda: extract_pages(pdf_bytes, workers=args.workers)),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# A local stand-in for the OpenAI chat completions and embeddings endpoints.
+#
+#   python -m benchmarks.stub_openai --port 8765 --latency 0.2 --rate-limit-every 5
+#   python -m benchmarks.stub_openai --latency 0.5 --max-concurrent 4
+#   python -m benchmarks.stub_openai --latency 0.3 --token-latency 0.01
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub streamlit run app.py
+#
+# Answers are deterministic: they echo the start of the last user message, so
+# callers can check which prompt produced which answer. Embeddings are the
+# offline HashEmbeddings vectors. --latency is the time to the first token and
+# --token-latency the time per answer word after it, streamed ("stream": true)
+# or not.
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, latency=0.0, rate_limit_every=0, max_concurrent=0, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit_every = rate_limit_every
+        # Requests beyond this many in flight get a 429, like an account's concurrency limit
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.throttled = 0
+        self.requests = 0
+        self.connections = 0
+        self.paths = {}
+        self.lock = threading.Lock()
+
+
+def _completion(body, content):
+    prompt_tokens = sum(len(message["content"].split()) for message in body.get("messages", []))
+    completion_tokens = len(content.split())
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _chunk(body, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+_KEY_POINTS = re.compile(r"Key points: (\[.*?\])")
+
+
+def answer_for(body):
+    messages = body.get("messages", [])
+    last = messages[-1]["content"] if messages else ""
+    if body.get("response_format", {}).get("type") == "json_object":
+        # Structured extraction: one summary per key point listed in the prompt
+        match = _KEY_POINTS.search(last)
+        key_points = json.loads(match.group(1)) if match else []
+        return json.dumps({key_point: f"Stub summary of {key_point}." for key_point in key_points})
+    if "comma-separated format" in last:
+        # comparison.identify_key_points
+        return "Revenue, Net Income, EBITDA, Profit Margin, Free Cash Flow"
+    return "Stub answer: " + " ".join(last.split()[:12])
+
+
+def _embeddings(body):
+    from embeddings import HashEmbeddings
+
+    texts = body.get("input", [])
+    texts = [texts] if isinstance(texts, str) else texts
+    vectors = HashEmbeddings().embed_documents(texts)
+    tokens = sum(len(text.split()) for text in texts)
+    return {
+        "object": "list",
+        "model": body.get("model", "stub"),
+        "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so connection reuse by the client shows up in state.connections
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, body, content):
+            # Server-sent events, one word per chunk; the connection closes with the stream
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            events = [_chunk(body, {"role": "assistant", "content": ""})]
+            events += [_chunk(body, {"content": word}) for word in re.findall(r"\S+\s*", content)]
+            events.append(_chunk(body, {}, "stop"))
+            if body.get("stream_options", {}).get("include_usage"):
+                usage = _completion(body, content)["usage"]
+                events.append(dict(_chunk(body, {}), choices=[], usage=usage))
+            for i, event in enumerate(events):
+                if i > 1:
+                    time.sleep(state.token_latency)
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.paths[self.path] = state.paths.get(self.path, 0) + 1
+                throttled = bool(state.rate_limit_every and state.requests % state.rate_limit_every == 0
+                                 or state.max_concurrent and state.active >= state.max_concurrent)
+                if throttled:
+                    state.throttled += 1
+                else:
+                    state.active += 1
+            if throttled:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                           {"retry-after": "0.05"})
+                return
+            try:
+                time.sleep(state.latency)
+                if self.path.endswith("/chat/completions") and body.get("stream"):
+                    self._stream(body, answer_for(body))
+                elif self.path.endswith("/chat/completions"):
+                    content = answer_for(body)
+                    time.sleep(state.token_latency * len(content.split()))
+                    self._send(200, _completion(body, content))
+                elif self.path.endswith("/embeddings"):
+                    self._send(200, _embeddings(body))
+                else:
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+    return Handler
+
+
+def start_server(port=0, latency=0.0, rate_limit_every=0, max_concurrent=0, token_latency=0.0):
+    # Returns (server, base_url); the server runs on a daemon thread until server.shutdown()
+    state = StubState(latency, rate_limit_every, max_concurrent, token_latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--max-concurrent", type=int, default=0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    server, base_url = start_server(args.port, args.latency, args.rate_limit_every, args.max_concurrent,
+                                    args.token_latency)
+    print(f"Stub OpenAI endpoint at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Synthetic financial filings for the offline benchmarks.
+import io
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+from handling_images import save_images_to_pdf
+
+COMPANIES = ["Northwind", "Contoso", "Fabrikam", "Tailspin", "Litware", "Adatum", "Proseware", "Wingtip"]
+METRICS = ["Revenue", "Net Income", "EBITDA", "Free Cash Flow", "Operating Margin", "Debt-to-Equity Ratio"]
+
+
+def page_text(rng, company, page, sentences=18):
+    lines = [f"{company} Annual Report - page {page}"]
+    for _ in range(sentences):
+        metric = rng.choice(METRICS)
+        lines.append(
+            f"{metric} for FY{rng.randint(19, 24)} was {rng.randint(10, 990)}.{rng.randint(0, 9)} million, "
+            f"a change of {rng.randint(-20, 35)}% year over year, driven by the {rng.choice(['retail', 'cloud', 'services', 'hardware'])} segment."
+        )
+    return "\n".join(lines)
+
+
+def make_text_pdf(pages, seed=0):
+    rng = random.Random(seed)
+    company = COMPANIES[seed % len(COMPANIES)]
+    doc = fitz.open()
+    for page in range(1, pages + 1):
+        fitz_page = doc.new_page()
+        fitz_page.insert_textbox(fitz.Rect(50, 50, 550, 800), page_text(rng, company, page), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class _NamedImage(io.BytesIO):
+    # save_images_to_pdf reads .name the way it would from a Streamlit UploadedFile
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def make_page_image(text, width=1275, height=1650):
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.load_default(size=22)
+    except TypeError:
+        font = ImageFont.load_default()
+    y = 60
+    for line in text.splitlines():
+        draw.text((60, y), line, fill=0, font=font)
+        y += 34
+    return image
+
+
+def make_scanned_pdf(pages, seed=0):
+    # Goes through the same reportlab path as uploaded images in the app
+    rng = random.Random(seed)
+    company = COMPANIES[seed % len(COMPANIES)]
+    images = []
+    for page in range(1, pages + 1):
+        buffer = io.BytesIO()
+        make_page_image(page_text(rng, company, page, sentences=12)).save(buffer, format="PNG")
+        images.append(_NamedImage(buffer.getvalue(), f"{company}_{page}.png"))
+    _, pdf_buffer = save_images_to_pdf(images)
+    return pdf_buffer.getvalue()
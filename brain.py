@@ -1,97 +1,57 @@
-import re
 import os
 from io import BytesIO
 from typing import Tuple, List
-import tempfile
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
 from PIL import Image
-import pytesseract
 
-from langchain_openai import OpenAIEmbeddings
-from langchain.docstore.document import Document
-from langchain_community.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+from extraction_cache import get_extraction_cache
+from indexing import index_files, text_to_docs
+from ocr_pipeline import OCRPipeline
+from tracing import span, traced
 
 # Load environment variables
 load_dotenv()
 
 # Set the TESSDATA_PREFIX environment variable to the current directory
+# (it is part of the OCR cache key, so it is set before anything reads the settings)
 tessdata_dir = os.path.dirname(os.path.abspath(__file__))
 os.environ["TESSDATA_PREFIX"] = tessdata_dir
 
-# Debug: Print the TESSDATA_PREFIX value
-print(f"TESSDATA_PREFIX set to: {os.environ['TESSDATA_PREFIX']}")
-
-# Ensure the TESSDATA_PREFIX is set correctly
-tessdata_path = os.path.join(tessdata_dir, "eng.traineddata")
-assert os.path.exists(tessdata_path), \
-    f"TESSDATA_PREFIX is not set correctly or eng.traineddata is missing. Expected at {tessdata_path}"
-
-# Set the path to the Tesseract executable
-pytesseract.pytesseract.tesseract_cmd = '/usr/bin/tesseract'
-
-def pdf_to_images(pdf_file):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-        temp_pdf.write(pdf_file.read())
-        temp_pdf_path = temp_pdf.name
-
-    images = convert_from_path(temp_pdf_path)
-    os.unlink(temp_pdf_path)
-
-    return images
-
-def parse_pdf(pdf_file: BytesIO, filename: str) -> Tuple[List[str], str]:
-    output = []
-    images = pdf_to_images(pdf_file)
-    for i, image in enumerate(images, start=1):
-        image_path = f'image_{i}.jpg'
-        image.save(image_path)
-
-        text = pytesseract.image_to_string(Image.open(image_path))
-
-        print(f"Page {i} OCR result:")
-        text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
-        text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
-        text = re.sub(r"\n\s*\n", "\n\n", text)
-        output.append(text)
+def parse_pdf(pdf_file: BytesIO, filename: str, progress=None) -> Tuple[List[str], str]:
+    with span("parse_pdf", extractor="ocr", filename=filename) as parse_span:
+        pipeline = OCRPipeline()
+        output = pipeline.run(pdf_file.getvalue(), cache=get_extraction_cache(), progress=progress)
+        stats = pipeline.last_stats
+        # Pages read from the embedded text layer vs. sent to Tesseract
+        parse_span.set(pages=len(output), text_pages=stats.get("text_pages", 0), ocr_pages=stats.get("ocr_pages", 0),
+                       cache_hits=stats.get("cached_pages", 0),
+                       cache_misses=stats.get("text_pages", 0) + stats.get("ocr_pages", 0))
     return output, filename
 
-def text_to_docs(text: List[str], filename: str) -> List[Document]:
-    if isinstance(text, str):
-        text = [text]
-    page_docs = [Document(page_content=page) for page in text]
-    for i, doc in enumerate(page_docs):
-        doc.metadata["page"] = i + 1
-
-    doc_chunks = []
-    for doc in page_docs:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-            chunk_overlap=200,
-        )
-        chunks = text_splitter.split_text(doc.page_content)
-        for i, chunk in enumerate(chunks):
-            doc = Document(
-                page_content=chunk, metadata={"page": doc.metadata["page"], "chunk": i}
-            )
-            doc.metadata["source"] = f"{doc.metadata['page']}-{doc.metadata['chunk']}"
-            doc.metadata["filename"] = filename
-            doc_chunks.append(doc)
-    return doc_chunks
-
-def docs_to_index(docs, openai_api_key):
-    index = FAISS.from_documents(docs, OpenAIEmbeddings(openai_api_key = openai_api_key))
-    return index
-
-def get_index_for_pdf(pdf_files, pdf_names, openai_api_key):
-    indices = []
-    for pdf_file, pdf_name in zip(pdf_files, pdf_names):
-        text, filename = parse_pdf(BytesIO(pdf_file), pdf_name)
-        docs = text_to_docs(text, filename)
-        index = docs_to_index(docs, openai_api_key)
-        indices.append(index)
-    return indices
-
+def parse_images(image_files: List[bytes], filenames: List[str], progress=None) -> List[List[str]]:
+    with span("parse_images", extractor="ocr-image", images=len(image_files)) as parse_span:
+        pipeline = OCRPipeline()
+        outputs = pipeline.run_images(image_files, cache=get_extraction_cache(), progress=progress)
+        parse_span.set(pages=pipeline.last_stats.get("pages", 0),
+                       cache_hits=pipeline.last_stats.get("cached_pages", 0),
+                       cache_misses=pipeline.last_stats.get("ocr_pages", 0))
+    return outputs
+
+def image_metadata(image_file: bytes) -> dict:
+    # Only the header is read
+    with Image.open(BytesIO(image_file)) as image:
+        return {"source_type": "image", "format": image.format, "width": image.width, "height": image.height}
+
+@traced("get_index_for_pdf")
+def get_index_for_pdf(pdf_files, pdf_names, openai_api_key, index=None, progress=None):
+    def extract(files, names):
+        # One PDF at a time, each chunked before the next is parsed
+        return (parse_pdf(BytesIO(pdf_file), pdf_name, progress)[0] for pdf_file, pdf_name in zip(files, names))
+
+    return index_files(pdf_files, pdf_names, openai_api_key, index, OCRPipeline().settings(), extract)
+
+@traced("get_index_for_images")
+def get_index_for_images(image_files, image_names, openai_api_key, index=None, progress=None):
+    # Each image is OCR'd straight from its own bytes and indexed as its own document
+    return index_files(image_files, image_names, openai_api_key, index, OCRPipeline().image_settings(),
+                       lambda files, names: parse_images(files, names, progress), metadata=image_metadata)
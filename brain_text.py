@@ -1,99 +1,99 @@
 import re
 from io import BytesIO, StringIO
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple, List
 import os
 from dotenv import load_dotenv
-import openai
-import streamlit as st
 
 import fitz  # PyMuPDF
-from langchain.docstore.document import Document
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-import faiss
+
+from config import get_openai_api_key, process_context
+from extraction_cache import content_hash, get_extraction_cache
+from indexing import index_files, text_to_docs
+from tracing import span, traced
 
 # Load environment variables
 load_dotenv()
-os.environ["OPENAI_API_KEY"] = st.secrets["OPENAI_API_KEY"]
-
-def extract_text_with_layout(file_obj):
-    doc = fitz.open(stream=file_obj.read(), filetype="pdf")
-    text_content = ""
-
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        text_content += page.get_text("text")
-
-    return text_content
-
-def extract_text_from_text_pdf(file_obj):
-    text_content = extract_text_with_layout(file_obj)
-
-    processed_data = {
-        'text': text_content,
-    }
-
-    if isinstance(processed_data, dict):
-        processed_data = str(processed_data)
-
-    return processed_data
-
-def parse_pdf(file: BytesIO, filename: str) -> Tuple[List[str], str]:
-    text = extract_text_from_text_pdf(file)
-    text = re.sub(r"(\w+)-\n(\w+)", r"\1\2", text)
-    
-    # Replace single newlines that are not followed by a space with a space
-    text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
-    
-    # Normalize multiple newlines to two newlines
-    text = re.sub(r"\n\s*\n", "\n\n", text)
-    # Replace multiple spaces with a single space
-    text = re.sub(r'\s+', ' ', text)
-    # Remove any non-printable characters
-    text = re.sub(r'[^\x20-\x7E]', '', text)
-    # Ensure there is a space between letters and numbers or vice versa
-    text = re.sub(r'(\D)(\d)', r'\1 \2', text)
-    text = re.sub(r'(\d)(\D)', r'\1 \2', text)
-    return [text], filename
-
-def text_to_docs(text: List[str], filename: str) -> List[Document]:
-    if isinstance(text, str):
-        text = [text]
-    page_docs = [Document(page_content=page) for page in text]
-    for i, doc in enumerate(page_docs):
-        doc.metadata["page"] = i + 1
-
-    doc_chunks = []
-    for doc in page_docs:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-            chunk_overlap=200,
-        )
-        chunks = text_splitter.split_text(doc.page_content)
-        for i, chunk in enumerate(chunks):
-            chunk_doc = Document(
-                page_content=chunk, metadata={"page": doc.metadata["page"], "chunk": i}
-            )
-            chunk_doc.metadata["source"] = f"{chunk_doc.metadata['page']}-{chunk_doc.metadata['chunk']}"
-            chunk_doc.metadata["filename"] = filename  # Add filename to metadata
-            doc_chunks.append(chunk_doc)
-    return doc_chunks
-
-def docs_to_index(docs, openai_api_key):
-    index = FAISS.from_documents(docs, OpenAIEmbeddings(openai_api_key=openai_api_key))
-    return index
-
-def get_index_for_text_pdf(pdf_files, pdf_names, openai_api_key=None):
+
+TEXT_EXTRACT_WORKERS = int(os.environ.get("TEXT_EXTRACT_WORKERS", os.cpu_count() or 1))
+# Smaller documents are not worth the cost of starting worker processes
+TEXT_EXTRACT_PARALLEL_MIN_PAGES = int(os.environ.get("TEXT_EXTRACT_PARALLEL_MIN_PAGES", 200))
+
+# Bump whenever normalize_page changes so cached pages are re-extracted
+NORMALIZE_VERSION = 3
+
+# Two passes per page. The first removes text: hyphens that split a word across a line break,
+# and non-printable characters other than whitespace. The second collapses whitespace and
+# separates digits from the letters/symbols around them, so it also sees the characters a
+# removal brought together ("2023-\nFY" -> "2023 FY")
+_REMOVE = re.compile(r"(?<=\w)-\n(?=\w)|[^\x20-\x7E\s]")
+_SEPARATE = re.compile(r"\s+|(?<=\d)(?=[^\d\s])|(?<=[^\d\s])(?=\d)")
+
+def normalize_page(text):
+    return _SEPARATE.sub(" ", _REMOVE.sub("", text)).strip()
+
+def iter_pages(pdf_bytes, start=0, stop=None):
+    # Pages are pulled from PyMuPDF one at a time; the whole document never exists as one string
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        for page_num in range(start, len(doc) if stop is None else stop):
+            yield doc.load_page(page_num).get_text("text")
+    finally:
+        doc.close()
+
+def _extract_range(pdf_bytes, start, stop):
+    return [normalize_page(text) for text in iter_pages(pdf_bytes, start, stop)]
+
+def extract_pages(pdf_bytes, workers=TEXT_EXTRACT_WORKERS, progress=None):
+    # progress(pages_done, pages_total) after every page, or every finished range when parallel
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        page_count = len(doc)
+    pages = []
+    if workers <= 1 or page_count < TEXT_EXTRACT_PARALLEL_MIN_PAGES:
+        for text in iter_pages(pdf_bytes):
+            pages.append(normalize_page(text))
+            if progress is not None:
+                progress(len(pages), page_count)
+        return pages
+
+    step = -(-page_count // workers)
+    starts = list(range(0, page_count, step))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as pool:
+        ranges = pool.map(_extract_range, [pdf_bytes] * len(starts), starts,
+                          [min(start + step, page_count) for start in starts])
+        for extracted in ranges:
+            pages.extend(extracted)
+            if progress is not None:
+                progress(len(pages), page_count)
+    return pages
+
+def extraction_settings():
+    return {"extractor": "pymupdf", "pymupdf": fitz.VersionBind, "normalize": NORMALIZE_VERSION}
+
+def parse_pdf(file: BytesIO, filename: str, progress=None) -> Tuple[List[str], str]:
+    with span("parse_pdf", extractor="text", filename=filename) as parse_span:
+        cache = get_extraction_cache()
+        doc_hash = content_hash(file.getvalue())
+        cached = cache.get_document(doc_hash, extraction_settings())
+        if cached is not None:
+            parse_span.set(pages=len(cached), cache_hits=1)
+            if progress is not None:
+                progress(len(cached), len(cached))
+            return cached, filename
+
+        # One entry per real page (empty pages included) so page numbers survive into text_to_docs
+        pages = extract_pages(file.getvalue(), progress=progress)
+        cache.put_document(doc_hash, extraction_settings(), pages)
+        parse_span.set(pages=len(pages), cache_misses=1)
+    return pages, filename
+
+@traced("get_index_for_text_pdf")
+def get_index_for_text_pdf(pdf_files, pdf_names, openai_api_key=None, index=None, progress=None):
     if openai_api_key is None:
-        openai_api_key = st.secrets["OPENAI_API_KEY"]
+        openai_api_key = get_openai_api_key()
 
-    documents = []
-    for pdf_file, pdf_name in zip(pdf_files, pdf_names):
-        text, filename = parse_pdf(BytesIO(pdf_file), pdf_name)
-        docs = text_to_docs(text, filename)
-        index = docs_to_index(docs, openai_api_key)
-        documents.append(index)
-    return documents
+    def extract(files, names):
+        # One PDF at a time, each chunked before the next is parsed
+        return (parse_pdf(BytesIO(pdf_file), pdf_name, progress)[0] for pdf_file, pdf_name in zip(files, names))
 
+    return index_files(pdf_files, pdf_names, openai_api_key, index, extraction_settings(), extract)
@@ -0,0 +1,103 @@
+import os
+from collections.abc import Sequence
+from math import gcd
+from typing import NamedTuple
+
+from langchain_core.documents import Document
+
+from tokenizer import TOKEN_ENCODING, get_encoding, token_offsets
+
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 256))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 48))
+
+
+class ChunkRecord(NamedTuple):
+    # A chunk is a character span of one page; its text is sliced out only when needed
+    doc_id: str
+    page: int
+    chunk: int
+    start: int
+    end: int
+
+    def text(self, pages):
+        return pages[self.page - 1][self.start:self.end]
+
+
+class ChunkDocuments(Sequence):
+    # A document's chunks as Documents. Only the offset records are held; each Document is
+    # sliced out of its page when read, so an upload waiting to be embedded stays small
+    def __init__(self, records, pages, filename, metadata=None):
+        self.records = records
+        self.pages = pages
+        self.filename = filename
+        self.metadata = metadata or {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        record = self.records[i]
+        return Document(
+            page_content=record.text(self.pages),
+            metadata={
+                "page": record.page,
+                "chunk": record.chunk,
+                "source": f"{record.page}-{record.chunk}",
+                "filename": self.filename,
+                "start": record.start,
+                "end": record.end,
+                **self.metadata,
+            },
+        )
+
+
+class TokenChunker:
+    def __init__(self, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def settings(self):
+        encoding = TOKEN_ENCODING if get_encoding() is not None else "approximate"
+        return {"chunk_tokens": self.chunk_tokens, "overlap_tokens": self.overlap_tokens, "encoding": encoding}
+
+    def chunk_page(self, doc_id, page, text):
+        step = self.chunk_tokens - self.overlap_tokens
+        # Window edges fall on multiples of gcd(step, chunk_tokens), except the final pulled-back window
+        offsets = token_offsets(text, gcd(step, self.chunk_tokens))
+        chunk = 0
+        for first in range(0, len(offsets), step):
+            last = first + self.chunk_tokens
+            if last > len(offsets) and first > 0:
+                # Pull the final window back so it is full-sized rather than a short remainder
+                first = max(0, len(offsets) - self.chunk_tokens)
+                last = len(offsets)
+            start = offsets[first]
+            end = offsets[last] if last < len(offsets) else len(text)
+            # Tokens usually carry their leading space; keep it out of the chunk
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if end > start:
+                yield ChunkRecord(doc_id, page, chunk, start, end)
+                chunk += 1
+            if last >= len(offsets):
+                break
+
+    def chunk_pages(self, doc_id, pages):
+        for page, text in enumerate(pages, start=1):
+            yield from self.chunk_page(doc_id, page, text)
+
+
+_chunker = None
+
+
+def get_chunker():
+    global _chunker
+    if _chunker is None:
+        _chunker = TokenChunker()
+    return _chunker
@@ -1,14 +1,14 @@
-from openai import OpenAI
-import pandas as pd
-import streamlit as st
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from context_packer import retrieve_packed
+from llm_executor import get_executor
+from tracing import current_span, traced
+
+NO_INFORMATION = "No specific information available."
 
 def get_completion(prompt, model="gpt-3.5-turbo", temperature=0):
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(
+    response = get_executor().chat(
         model=model,
         messages=messages,
         temperature=temperature
@@ -32,11 +32,10 @@ def identify_key_points(question):
     response = get_completion(prompt, temperature=0.3)
     return [point.strip() for point in response.split(',')]
 
-def perform_similarity_search(vectordbs, question, key_points):
+def perform_similarity_search(vectordb, question, key_points, query_vector=None, lexical_only=False):
     pdf_extracts = []
-    for vectordb in vectordbs:
-        search_results = vectordb.similarity_search(question, k=10)
-        pdf_extract = "\n".join([result.page_content for result in search_results])
+    for context in retrieve_packed(vectordb, question, query_vector, lexical_only=lexical_only):
+        pdf_extract = context.text
         
         # Add key points to the pdf_extract
         pdf_extract += f"\n\nKey Points for Analysis: {', '.join(key_points)}"
@@ -57,20 +56,86 @@ def extract_key_point_info(response, key_point):
     """
     return get_completion(prompt, temperature=0.1)
 
-def compare_responses_via_api(question, vectordbs, document_names):
+def key_points_extraction_request(response, key_points):
+    prompt = f"""
+    Extract and summarize information related to each of the following key points from the text below.
+    Key points: {json.dumps(key_points)}
+    Text:
+    {response}
+    Respond with a JSON object that has exactly one entry per key point, using the key point text as the key.
+    Each value must be a concise summary that:
+    1. Focuses on relevant facts, figures, and brief details
+    2. Is no longer than 2-3 sentences
+    3. Highlights any quantitative data if available
+    4. Maintains objectivity and accuracy
+    If no relevant information is found for a key point, use "{NO_INFORMATION}" as its value.
+    """
+    return {
+        "model": "gpt-3.5-turbo",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.1,
+        "response_format": {"type": "json_object"},
+    }
+
+def parse_key_points_extraction(content, key_points):
+    # Returns {key_point: summary} for every key point, or None if the reply is not usable JSON
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    by_name = {str(name).strip().lower(): value for name, value in data.items()}
+    extracted = {}
+    for key_point in key_points:
+        value = by_name.get(key_point.strip().lower())
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        extracted[key_point] = str(value).strip() if value not in (None, "") else NO_INFORMATION
+    return extracted
+
+def unavailable(error):
+    return f"{NO_INFORMATION} (request failed: {type(error).__name__})"
+
+@traced("compare_responses_via_api")
+def compare_responses_via_api(question, vectordbs, document_names, query_vector=None, lexical_only=False):
     key_points = identify_key_points(question)
-    pdf_extracts = perform_similarity_search(vectordbs, question, key_points)
-    
+    pdf_extracts = perform_similarity_search(vectordbs, question, key_points, query_vector, lexical_only)
+
     comparison_data = {"Document": document_names}
-    
-    def process_key_point(key_point):
-        return [extract_key_point_info(extract, key_point) for extract in pdf_extracts]
-    
-    with ThreadPoolExecutor() as executor:
-        futures = {key_point: executor.submit(process_key_point, key_point) for key_point in key_points}
-        for key_point, future in futures.items():
-            comparison_data[key_point] = future.result()
-    
+    for key_point in key_points:
+        comparison_data[key_point] = []
+
+    # One structured call per document instead of one call per (key point, document) pair
+    requests = [key_points_extraction_request(extract, key_points) for extract in pdf_extracts]
+    fallbacks = failed_requests = 0
+    for extract, completion in zip(pdf_extracts, get_executor().map_chat(requests)):
+        if isinstance(completion, Exception):
+            # The executor already spent its retries; more calls to the same endpoint would not help
+            extracted = dict.fromkeys(key_points, unavailable(completion))
+            failed_requests += 1
+        else:
+            extracted = parse_key_points_extraction(completion.choices[0].message.content, key_points)
+        if extracted is None:
+            # The reply was not usable JSON: fall back to the per-key-point prompts for this document only
+            extracted = {}
+            for key_point in key_points:
+                try:
+                    extracted[key_point] = extract_key_point_info(extract, key_point)
+                except Exception as e:
+                    extracted[key_point] = unavailable(e)
+                    failed_requests += 1
+            fallbacks += 1
+        for key_point in key_points:
+            comparison_data[key_point].append(extracted[key_point])
+
+    current_span().set(documents=len(document_names), key_points=len(key_points), fallbacks=fallbacks,
+                       failed_requests=failed_requests)
+    import pandas as pd
+
     df = pd.DataFrame(comparison_data)
-    
+
     return df
+
+def comparison_key(question, vectordb):
+    return f"{question}\x00{vectordb.fingerprint()}"
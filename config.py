@@ -0,0 +1,28 @@
+import os
+
+# How worker pools start their processes. Forking would copy the threads and held locks of a running
+# Streamlit server (or ingest worker) into each child; "forkserver" forks from a clean helper instead
+PROCESS_START_METHOD = os.environ.get("PROCESS_START_METHOD", "forkserver")
+
+def get_openai_api_key():
+    # The environment wins (workers, benchmarks, CI); the app falls back to Streamlit secrets.
+    # Read on first use so importing a module never touches st.secrets
+    key = os.environ.get("OPENAI_API_KEY")
+    if key:
+        return key
+    import streamlit as st
+
+    key = st.secrets["OPENAI_API_KEY"]
+    # The OpenAI and LangChain clients read the key from the environment
+    os.environ["OPENAI_API_KEY"] = key
+    return key
+
+
+def process_context():
+    # The multiprocessing context for ProcessPoolExecutor(mp_context=...); spawn where forkserver is missing
+    import multiprocessing
+
+    method = PROCESS_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    return multiprocessing.get_context(method)
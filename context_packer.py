@@ -0,0 +1,157 @@
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from tokenizer import count_tokens
+from tracing import span
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_FETCH_K = int(os.environ.get("CONTEXT_FETCH_K", 20))
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", 0.7))
+
+
+class PackedContext(NamedTuple):
+    text: str
+    tokens: int
+    baseline_tokens: int
+    chunks: int
+
+    @property
+    def tokens_saved(self):
+        return self.baseline_tokens - self.tokens
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _span_key(doc):
+    return doc.metadata.get("doc_id"), doc.metadata.get("page")
+
+
+def _new_text(doc, covered):
+    # The part of doc not already covered by selected chunks from the same page
+    start, end = doc.metadata.get("start"), doc.metadata.get("end")
+    if start is None or end is None:
+        return doc.page_content
+    pieces = []
+    cursor = start
+    for covered_start, covered_end in sorted(covered.get(_span_key(doc), [])):
+        if covered_end <= cursor or covered_start >= end:
+            continue
+        if covered_start > cursor:
+            pieces.append(doc.page_content[cursor - start:covered_start - start])
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        pieces.append(doc.page_content[cursor - start:])
+    return " ".join(piece.strip() for piece in pieces if piece.strip())
+
+
+def _merge_spans(selected):
+    # Chunks that overlap or touch on the same page are stitched back into one passage
+    groups = {}
+    for rank, doc in enumerate(selected):
+        groups.setdefault(_span_key(doc), []).append((rank, doc))
+
+    passages = []
+    for members in groups.values():
+        if members[0][1].metadata.get("start") is None:
+            passages.extend((rank, doc.page_content) for rank, doc in members)
+            continue
+        members.sort(key=lambda member: member[1].metadata["start"])
+        rank, doc = members[0]
+        text, end = doc.page_content, doc.metadata["end"]
+        for member_rank, member in members[1:]:
+            member_start, member_end = member.metadata["start"], member.metadata["end"]
+            if member_start <= end:
+                if member_end > end:
+                    text += member.page_content[end - member_start:]
+                    end = member_end
+            else:
+                passages.append((rank, text))
+                rank, text, end = member_rank, member.page_content, member_end
+            rank = min(rank, member_rank)
+        passages.append((rank, text))
+    # Most relevant passage first
+    return [text for _, text in sorted(passages, key=lambda passage: passage[0])]
+
+
+def pack_context(docs, doc_vectors, query_vector, budget=CONTEXT_TOKEN_BUDGET, baseline_k=10,
+                 mmr_lambda=MMR_LAMBDA, relevance=None):
+    # docs arrive in ranked order; baseline is what the prompt used to get: the top
+    # baseline_k chunks joined with newlines, overlaps and all. relevance replaces the
+    # similarity to query_vector, e.g. fused retrieval scores scaled to [0, 1]
+    baseline_tokens = count_tokens("\n".join(doc.page_content for doc in docs[:baseline_k]))
+    if not docs:
+        return PackedContext("", 0, baseline_tokens, 0)
+
+    vectors = _normalize(np.asarray(doc_vectors, dtype="float32"))
+    if relevance is None:
+        relevance = vectors @ _normalize(np.asarray(query_vector, dtype="float32"))
+    else:
+        relevance = np.asarray(relevance, dtype="float32")
+    similarity = vectors @ vectors.T
+
+    selected, selected_rows, covered = [], [], {}
+    remaining = list(range(len(docs)))
+    used = 0
+    while remaining:
+        if selected_rows:
+            redundancy = similarity[np.ix_(remaining, selected_rows)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+
+        picked = None
+        for position in np.argsort(-scores):
+            row = remaining[position]
+            cost = count_tokens(_new_text(docs[row], covered))
+            if used + cost <= budget:
+                picked = row
+                break
+        if picked is None:
+            break
+
+        doc = docs[picked]
+        used += cost
+        remaining.remove(picked)
+        selected.append(doc)
+        selected_rows.append(picked)
+        if doc.metadata.get("start") is not None:
+            covered.setdefault(_span_key(doc), []).append((doc.metadata["start"], doc.metadata["end"]))
+
+    text = "\n".join(_merge_spans(selected))
+    return PackedContext(text, count_tokens(text), baseline_tokens, len(selected))
+
+
+def retrieve_packed(vectordb, question, query_vector=None, budget=CONTEXT_TOKEN_BUDGET,
+                    fetch_k=CONTEXT_FETCH_K, baseline_k=10, lexical_only=False):
+    # One packed context per indexed document, in the index's document order. Vector and
+    # BM25 results are fused; if the question cannot be embedded in time, BM25 answers alone.
+    # lexical_only means a caller already gave up on the embedding, so it is not retried
+    from embeddings import embed_question
+
+    with span("similarity_search", documents=len(vectordb), k=fetch_k) as search_span:
+        if query_vector is None and not lexical_only:
+            query_vector = embed_question(vectordb.embedder, question)
+        results = vectordb.hybrid_search(question, k=fetch_k, query_vector=query_vector)
+        packed = []
+        for ranked in results.values():
+            docs = [doc for doc, _ in ranked]
+            vectors = vectordb.chunk_vectors(docs) if docs else []
+            # Fused scores rank lexical-only hits too, which the query vector alone would demote
+            scores = np.asarray([score for _, score in ranked], dtype="float32")
+            relevance = scores / scores.max() if docs else None
+            packed.append(pack_context(docs, vectors, query_vector, budget, baseline_k, relevance=relevance))
+        report = context_report(packed)
+        search_span.set(context_tokens=report["packed_tokens"], saved_tokens=report["tokens_saved"],
+                        lexical_only=query_vector is None)
+    return packed
+
+
+def context_report(packed):
+    baseline = sum(context.baseline_tokens for context in packed)
+    tokens = sum(context.tokens for context in packed)
+    return {"baseline_tokens": baseline, "packed_tokens": tokens, "tokens_saved": baseline - tokens}
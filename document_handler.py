@@ -1,69 +1,71 @@
 import streamlit as st
-from handling_images import save_images_to_pdf
-
-openai_api_key = st.secrets["OPENAI_API_KEY"]
+from config import get_openai_api_key
+from ingestion import IngestionManager
 
 def initialize_session_state():
-    if 'pdf_files' not in st.session_state:
-        st.session_state.pdf_files = []
-
-    if 'image_files' not in st.session_state:
-        st.session_state.image_files = []
-
-    if 'text_pdf_files' not in st.session_state:
-        st.session_state.text_pdf_files = []
-
     if 'show_pdfs' not in st.session_state:
         st.session_state.show_pdfs = False
 
+def is_active(job):
+    return job["status"] in ("queued", "running")
+
+def show_job(job):
+    if job["status"] == "failed":
+        st.error(f"Could not process \"{job['name']}\": {job['error']}")
+    elif job["pages_total"]:
+        done = job["pages_done"] >= job["pages_total"]
+        label = "embedding" if done else f"page {job['pages_done']} of {job['pages_total']}"
+        st.progress(job["pages_done"] / job["pages_total"], text=f"Processing \"{job['name']}\": {label}")
+    else:
+        st.progress(0.0, text=f"Waiting to process \"{job['name']}\"")
+
+@st.fragment(run_every=1)
+def show_ingestion_progress():
+    # Polls the background jobs. A finished job triggers a full rerun so its document joins the
+    # index; so does the last active job ending, and that rerun no longer starts this fragment
+    jobs = st.session_state.ingestion.pending()
+    for job in jobs:
+        show_job(job)
+    if any(job["status"] == "done" for job in jobs) or not any(is_active(job) for job in jobs):
+        st.rerun()
+
 def handle_file_uploads():
     text_pdf_files = st.file_uploader("Upload Text PDF(s)", type="pdf", accept_multiple_files=True, key="text_pdf_upload")
     uploaded_pdf_files = st.file_uploader("Scanned/Handwritten PDF(s)", type="pdf", accept_multiple_files=True)
     image_files = st.file_uploader("Upload Image(s)", type=["png", "jpg", "jpeg", "gif"], accept_multiple_files=True, key="image_upload")
 
-    if uploaded_pdf_files is not None:
-        for file in uploaded_pdf_files:
-            st.session_state.pdf_files.append((file.name, file))
-
-    if image_files is not None:
-        st.session_state.image_files.extend(image_files)
-        if st.session_state.image_files:
-            pdf_name, pdf_buffer = save_images_to_pdf(st.session_state.image_files)
-            st.session_state.pdf_files.append((pdf_name, pdf_buffer))
-            st.session_state.image_files = []
-            st.session_state.show_pdfs = True
-
-    if text_pdf_files is not None:
-        for file in text_pdf_files:
-            #text_content = extract_text_from_text_pdf(file)
-            st.session_state.text_pdf_files.append((file.name, file))
-
-    if 'vectordbs' not in st.session_state and (st.session_state.pdf_files or st.session_state.text_pdf_files):
-        pdf_file_names = [name for name, _ in st.session_state.pdf_files]
-        pdf_buffers = [buffer for _, buffer in st.session_state.pdf_files]
-        text_pdf_file_names = [name for name, _ in st.session_state.text_pdf_files]
-        text_pdf = [text for _, text in st.session_state.text_pdf_files]
-        
-        # Store document names for later use
-        st.session_state.document_names = pdf_file_names + text_pdf_file_names
-        
-        st.session_state["vectordbs"] = create_vectordb(pdf_buffers, pdf_file_names, text_pdf, text_pdf_file_names)
-
-@st.cache_resource
-def create_vectordb(image_pdf_files, image_pdf_filenames, text_pdf, text_pdf_file_names):
-    from brain import get_index_for_pdf
-
-    # Process image PDFs
-    image_vectordbs = get_index_for_pdf(
-        [file.getvalue() for file in image_pdf_files], image_pdf_filenames, openai_api_key = st.secrets["OPENAI_API_KEY"] )
-
-    # Process text PDFs
-    from brain_text import get_index_for_text_pdf
-    text_vectordbs = get_index_for_text_pdf(
-        [file.getvalue() for file in text_pdf], text_pdf_file_names, openai_api_key = st.secrets["OPENAI_API_KEY"] )
-    
-
-    return image_vectordbs + text_vectordbs
-    
-
-
+    if "ingestion" not in st.session_state:
+        st.session_state.ingestion = IngestionManager(get_openai_api_key())
+
+    # The uploaders always return the full current selection, so this is the source of truth
+    uploads = []
+    for file in uploaded_pdf_files or []:
+        uploads.append(("scanned", file.name, file.getvalue()))
+
+    # Images go straight to OCR, one document per image
+    for file in image_files or []:
+        uploads.append(("image", file.name, file.getvalue()))
+    if image_files:
+        st.session_state.show_pdfs = True
+
+    for file in text_pdf_files or []:
+        uploads.append(("text", file.name, file.getvalue()))
+
+    # Only new files are processed; removed files have their vectors dropped
+    index = st.session_state.ingestion.index
+    st.session_state.ingestion.sync(uploads)
+    jobs = st.session_state.ingestion.pending()
+    if any(is_active(job) for job in jobs):
+        show_ingestion_progress()
+    else:
+        # Only failures are left; they stay listed without polling
+        for job in jobs:
+            show_job(job)
+
+    if index:
+        st.session_state["vectordbs"] = index
+        # Store document names for later use, in the same order the index reports results
+        st.session_state.document_names = index.document_names()
+    else:
+        st.session_state.pop("vectordbs", None)
+        st.session_state.document_names = []
@@ -0,0 +1,214 @@
+import contextvars
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from extraction_cache import CACHE_DIR
+from tracing import span
+
+# "openai" for production, "hash" for the deterministic offline embedder
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "openai")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 512))
+# Recent question vectors kept in memory in front of the on-disk store
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 1024))
+# Retrieval stops waiting for the question's embedding after this long and answers from BM25 alone
+QUERY_EMBED_TIMEOUT = float(os.environ.get("QUERY_EMBED_TIMEOUT", 3.0))
+
+_WORD = re.compile(r"\w+")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class HashEmbeddings(Embeddings):
+    # Feature-hashed bag of words: no network, same vector for the same text on every run,
+    # and texts sharing words land close together, which keeps retrieval meaningful in tests
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+        self.model = f"hash-{dimensions}"
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class GatewayEmbeddings(Embeddings):
+    # OpenAI embeddings sent through the shared LLM executor, so they use its connection pool,
+    # rate limits and request coalescing rather than a client of their own
+    def __init__(self, model, executor=None):
+        self.model = model
+        self._executor = executor
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from llm_executor import get_executor
+
+            self._executor = get_executor()
+        return self._executor
+
+    def embed_documents(self, texts):
+        return self.executor.embed(texts, self.model) if texts else []
+
+    def embed_query(self, text):
+        return self.executor.embed([text], self.model)[0]
+
+
+class EmbeddingStore:
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT, text_hash TEXT, vector BLOB,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        found = {}
+        hashes = list(hashes)
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, model, items):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(model, key, array("f", vector).tobytes()) for key, vector in items],
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner, model, store=None, batch_size=EMBEDDING_BATCH_SIZE):
+        self.inner = inner
+        self.model = model
+        self.store = store if store is not None else EmbeddingStore()
+        self.batch_size = batch_size
+        self.stats = {"requested": 0, "unique": 0, "cached": 0, "embedded": 0, "queries": 0, "queries_cached": 0}
+        self._queries = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with span("embed_documents", model=self.model, texts=len(texts)) as embed_span:
+            hashes = [text_hash(text) for text in texts]
+            unique = dict(zip(hashes, texts))
+            found = self.store.get_many(self.model, unique)
+            missing = [key for key in unique if key not in found]
+
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                vectors = self.inner.embed_documents([unique[key] for key in batch])
+                self.store.put_many(self.model, zip(batch, vectors))
+                found.update(zip(batch, vectors))
+            embed_span.set(cache_hits=len(unique) - len(missing), cache_misses=len(missing))
+
+        self.stats["requested"] += len(texts)
+        self.stats["unique"] += len(unique)
+        self.stats["cached"] += len(unique) - len(missing)
+        self.stats["embedded"] += len(missing)
+        return [found[key] for key in hashes]
+
+    def embed_query(self, text):
+        # The same question is embedded once: by the answer cache lookup, retrieval and the
+        # comparison table alike, and again only after dropping out of both caches
+        key = text_hash(text)
+        with span("embed_query", model=self.model) as query_span:
+            with self._queries_lock:
+                vector = self._queries.get(key)
+                if vector is not None:
+                    self._queries.move_to_end(key)
+            if vector is None:
+                vector = self.store.get_many(self.model, [key]).get(key)
+            cached = vector is not None
+            if not cached:
+                vector = self.inner.embed_query(text)
+                self.store.put_many(self.model, [(key, vector)])
+            with self._queries_lock:
+                self._queries[key] = vector
+                self._queries.move_to_end(key)
+                while len(self._queries) > QUERY_CACHE_SIZE:
+                    self._queries.popitem(last=False)
+                # Questions are embedded on _query_pool threads
+                self.stats["queries"] += 1
+                self.stats["queries_cached"] += cached
+            query_span.set(cache_hits=int(cached), cache_misses=int(not cached))
+        return vector
+
+
+def embed_per_file(embedder, docs_per_file):
+    # One deduplicated, batched embedding pass for a whole upload, handed back per file
+    texts = [doc.page_content for docs in docs_per_file for doc in docs]
+    vectors = embedder.embed_documents(texts)
+    vectors_per_file = []
+    offset = 0
+    for docs in docs_per_file:
+        vectors_per_file.append(vectors[offset:offset + len(docs)])
+        offset += len(docs)
+    return vectors_per_file
+
+
+_query_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+
+
+def embed_question(embedder, question, timeout=QUERY_EMBED_TIMEOUT):
+    # The question's vector, or None when embedding fails or takes longer than timeout. A late
+    # vector still lands in the query cache, so the next lookup of the question is instant
+    future = _query_pool.submit(contextvars.copy_context().run, embedder.embed_query, question)
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        return None
+
+
+_embedders = {}
+
+
+def get_embedder(openai_api_key=None, provider=EMBEDDING_PROVIDER, model=EMBEDDING_MODEL):
+    # openai_api_key is kept for callers; the executor's client reads it through config
+    key = (provider, model)
+    if key not in _embedders:
+        if provider == "hash":
+            inner = HashEmbeddings()
+            model = inner.model
+        else:
+            inner = GatewayEmbeddings(model)
+        _embedders[key] = CachedEmbeddings(inner, model)
+    return _embedders[key]
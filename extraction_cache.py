@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_DIR = os.environ.get(
+    "RAG_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".rag_cache")
+)
+EXTRACTION_CACHE_MAX_BYTES = int(os.environ.get("EXTRACTION_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def settings_key(settings: dict) -> str:
+    return json.dumps(settings, sort_keys=True)
+
+
+class ExtractionCache:
+    def __init__(self, path=None, max_bytes=EXTRACTION_CACHE_MAX_BYTES):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "extraction.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                doc_hash TEXT, settings TEXT, page INTEGER, text TEXT,
+                size INTEGER, last_access REAL,
+                PRIMARY KEY (doc_hash, settings, page)
+            );
+            CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access);
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT, settings TEXT, page_count INTEGER,
+                PRIMARY KEY (doc_hash, settings)
+            );
+        """)
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+
+    def get_pages(self, doc_hash, settings):
+        key = settings_key(settings)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM pages WHERE doc_hash = ? AND settings = ?", (doc_hash, key)
+            ).fetchall()
+            if rows:
+                self._conn.execute(
+                    "UPDATE pages SET last_access = ? WHERE doc_hash = ? AND settings = ?",
+                    (time.time(), doc_hash, key),
+                )
+                self._conn.commit()
+        return dict(rows)
+
+    def get_document(self, doc_hash, settings):
+        # Only a complete document counts as a hit; partial documents go through get_pages
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_count FROM documents WHERE doc_hash = ? AND settings = ?",
+                (doc_hash, settings_key(settings)),
+            ).fetchone()
+        if row is None:
+            return None
+        pages = self.get_pages(doc_hash, settings)
+        if len(pages) != row[0]:
+            return None
+        return [pages[page] for page in range(1, row[0] + 1)]
+
+    def put_page(self, doc_hash, settings, page, text):
+        size = len(text.encode("utf-8"))
+        key = settings_key(settings)
+        with self._lock:
+            # A re-extracted page replaces its row, so only the difference in size is added
+            replaced = self._conn.execute(
+                "SELECT size FROM pages WHERE doc_hash = ? AND settings = ? AND page = ?", (doc_hash, key, page)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_hash, key, page, text, size, time.time()),
+            )
+            self._total += size - (replaced[0] if replaced is not None else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def set_page_count(self, doc_hash, settings, page_count):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                (doc_hash, settings_key(settings), page_count),
+            )
+            self._conn.commit()
+
+    def put_document(self, doc_hash, settings, pages):
+        for page, text in enumerate(pages, start=1):
+            self.put_page(doc_hash, settings, page, text)
+        self.set_page_count(doc_hash, settings, len(pages))
+
+    def _evict(self):
+        # The running total drifts when other processes share the file, so recount before evicting
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        rows = self._conn.execute("SELECT rowid, size FROM pages ORDER BY last_access").fetchall()
+        doomed = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM pages WHERE rowid = ?", doomed)
+        self._total = total
+
+
+_cache = None
+
+
+def get_extraction_cache():
+    global _cache
+    if _cache is None:
+        _cache = ExtractionCache()
+    return _cache
@@ -6,10 +6,12 @@ from reportlab.lib.utils import ImageReader
 
 def save_images_to_pdf(images):
     pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=letter)
+    # invariant=1 drops the timestamp so the same images always give the same bytes (and content hash)
+    c = canvas.Canvas(pdf_buffer, pagesize=letter, invariant=1)
     pdf_name = '_'.join(image_file.name for image_file in images) + '.pdf'
 
     for image in images:
+        image.seek(0)
         img = Image.open(image)
         img_width, img_height = img.size
         scale = min(letter[0] / img_width, letter[1] / img_height)
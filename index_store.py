@@ -0,0 +1,124 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from extraction_cache import CACHE_DIR, settings_key
+from lexical_index import build_postings, load_postings, save_postings
+
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", os.path.join(CACHE_DIR, "indexes"))
+
+
+class StoredChunks(Sequence):
+    # Chunk texts stay in a memory-mapped JSON-lines file; a Document is only
+    # built for the chunks a search actually returns
+    def __init__(self, path, offsets):
+        self._offsets = offsets
+        self._map = None
+        if len(offsets) > 1:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        record = json.loads(self._map[int(self._offsets[i]):int(self._offsets[i + 1])])
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+
+class IndexStore:
+    # Per-document vectors, chunk texts, metadata and BM25 postings on local disk, keyed
+    # by the document's content hash and the settings that produced them
+    def __init__(self, root=INDEX_DIR):
+        self.root = root
+
+    def _path(self, doc_id, settings):
+        namespace = hashlib.sha256(settings_key(settings).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, namespace, doc_id)
+
+    def has(self, doc_id, settings):
+        return os.path.exists(os.path.join(self._path(doc_id, settings), "meta.json"))
+
+    def save(self, doc_id, settings, docs, vectors):
+        path = self._path(doc_id, settings)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent)
+
+        offsets = [0]
+        with open(os.path.join(staging, "chunks.jsonl"), "wb") as f:
+            for doc in docs:
+                line = json.dumps({"text": doc.page_content, "metadata": doc.metadata}).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.save(os.path.join(staging, "offsets.npy"), np.asarray(offsets, dtype="int64"))
+        np.save(os.path.join(staging, "vectors.npy"), np.asarray(vectors, dtype="float32"))
+        save_postings(os.path.join(staging, "lexical.npz"), build_postings(doc.page_content for doc in docs))
+        # meta.json is written last: its presence marks a complete entry
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"count": len(offsets) - 1, "settings": settings}, f)
+
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another worker stored the same document first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def load(self, doc_id, settings):
+        path = self._path(doc_id, settings)
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        mmap_mode = "r" if len(offsets) > 1 else None
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        # Entries stored before the lexical index existed get their postings built on load
+        lexical = os.path.join(path, "lexical.npz")
+        postings = load_postings(lexical) if os.path.exists(lexical) else None
+        return StoredChunks(os.path.join(path, "chunks.jsonl"), offsets), vectors, postings
+
+    def delete(self, doc_id, settings):
+        shutil.rmtree(self._path(doc_id, settings), ignore_errors=True)
+
+    def _trained_path(self, settings):
+        namespace = hashlib.sha256(settings_key(settings).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, "trained", f"{namespace}.faiss")
+
+    def load_trained(self, settings):
+        # A trained but empty FAISS index (quantizer and codebooks) saved by an earlier session, or None
+        path = self._trained_path(settings)
+        if not os.path.exists(path):
+            return None
+        import faiss
+
+        return faiss.read_index(path)
+
+    def save_trained(self, settings, index):
+        import faiss
+
+        path = self._trained_path(settings)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, staging = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        faiss.write_index(index, staging)
+        os.replace(staging, path)
+
+
+_store = None
+
+
+def get_index_store():
+    global _store
+    if _store is None:
+        _store = IndexStore()
+    return _store
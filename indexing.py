@@ -0,0 +1,80 @@
+from typing import List, Sequence
+
+from langchain_core.documents import Document
+
+from chunking import ChunkDocuments, get_chunker
+from embeddings import embed_per_file, get_embedder
+from extraction_cache import content_hash
+from index_store import get_index_store
+from tracing import current_span, traced
+from vector_index import DocumentIndex
+
+
+@traced("text_to_docs")
+def text_to_docs(text: List[str], filename: str, doc_id: str = None, metadata: dict = None) -> Sequence[Document]:
+    if isinstance(text, str):
+        text = [text]
+
+    # Documents are built from the chunker's offset records as they are read
+    doc_chunks = ChunkDocuments(list(get_chunker().chunk_pages(doc_id, text)), text, filename, metadata)
+    current_span().set(filename=filename, pages=len(text), chunks=len(doc_chunks))
+    return doc_chunks
+
+
+def index_settings(embedder, extraction):
+    # Everything that shapes the stored chunks and vectors for a document
+    return {
+        "extraction": extraction,
+        "chunking": get_chunker().settings(),
+        "embedding": embedder.model,
+    }
+
+
+@traced("docs_to_index")
+def docs_to_index(docs, openai_api_key, index, doc_id, filename, extraction, vectors=None):
+    current_span().set(filename=filename, chunks=len(docs))
+    embedder = get_embedder(openai_api_key)
+    if vectors is None:
+        vectors = embedder.embed_documents([doc.page_content for doc in docs])
+    store = get_index_store()
+    settings = index_settings(embedder, extraction)
+    store.save(doc_id, settings, docs, vectors)
+    # Serve from the stored copy so the vectors are memory-mapped like any later load
+    index.add_document(doc_id, filename, *store.load(doc_id, settings))
+    return index
+
+
+def index_files(files, names, openai_api_key, index, extraction, extract, metadata=None):
+    # The body of every get_index_for_* function. Files already in the index are skipped and
+    # stored ones are loaded; extract(files, names) yields the pages of each remaining file,
+    # and metadata(file), if given, is added to every chunk of that file
+    embedder = get_embedder(openai_api_key)
+    if index is None:
+        index = DocumentIndex(embedder)
+    store = get_index_store()
+    settings = index_settings(embedder, extraction)
+
+    to_extract = []
+    stored = 0
+    for data, name in zip(files, names):
+        doc_id = content_hash(data)
+        if doc_id in index:
+            continue
+        if store.has(doc_id, settings):
+            index.add_document(doc_id, name, *store.load(doc_id, settings))
+            stored += 1
+            continue
+        to_extract.append((doc_id, name, data))
+
+    pending = []
+    pages_per_file = extract([data for _, _, data in to_extract], [name for _, name, _ in to_extract])
+    for (doc_id, name, data), pages in zip(to_extract, pages_per_file):
+        docs = text_to_docs(pages, name, doc_id, metadata(data) if metadata is not None else None)
+        pending.append((doc_id, name, docs))
+
+    # Documents loaded from the index store are hits; the pending ones are extracted and embedded
+    current_span().set(documents=len(files), cache_hits=stored, cache_misses=len(pending))
+    vectors_per_file = embed_per_file(embedder, [docs for _, _, docs in pending])
+    for (doc_id, filename, docs), vectors in zip(pending, vectors_per_file):
+        docs_to_index(docs, openai_api_key, index, doc_id, filename, extraction, vectors)
+    return index
@@ -0,0 +1,148 @@
+# Background ingestion worker.
+#
+#   python -m ingest_worker reports/*.pdf scans/*.png      # enqueue, work through the queue, exit
+#   python -m ingest_worker --workers 4                     # serve the queue until interrupted
+#
+# Workers claim jobs from job_queue, run the same get_index_for_* functions as the
+# app and persist the result in the index store, where the app picks it up. A
+# worker that dies mid-job stops heartbeating; the next worker reclaims the job
+# and the extraction cache lets it continue from the last completed page.
+import argparse
+import os
+import socket
+import threading
+import time
+from multiprocessing import Process
+
+from job_queue import JobQueue, get_job_queue
+
+INGEST_POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", 1.0))
+# Text PDFs report every page; the queue is written at most this often (and on the last page)
+INGEST_PROGRESS_SECONDS = float(os.environ.get("INGEST_PROGRESS_SECONDS", 0.25))
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".tif", ".tiff")
+
+
+def index_function(kind):
+    if kind == "text":
+        from brain_text import get_index_for_text_pdf
+        return get_index_for_text_pdf
+    if kind == "image":
+        from brain import get_index_for_images
+        return get_index_for_images
+    from brain import get_index_for_pdf
+    return get_index_for_pdf
+
+
+class Worker:
+    def __init__(self, queue=None, openai_api_key=None, name=None):
+        self.queue = queue if queue is not None else get_job_queue()
+        self.openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def run_job(self, job):
+        data = self.queue.payload(job)
+        function = index_function(job["kind"])
+
+        # Progress updates double as heartbeats, but embedding a large document reports none
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(self.queue.stale_seconds / 4):
+                self.queue.heartbeat(job["id"])
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        last_report = [0.0]
+
+        def progress(done, total):
+            now = time.monotonic()
+            if done >= total or now - last_report[0] >= INGEST_PROGRESS_SECONDS:
+                last_report[0] = now
+                self.queue.progress(job["id"], done, total)
+
+        try:
+            function([data], [job["name"]], self.openai_api_key, progress=progress)
+        finally:
+            stop.set()
+
+    def run_once(self):
+        # Returns False when there was nothing to do
+        job = self.queue.claim(self.name)
+        if job is None:
+            return False
+        try:
+            self.run_job(job)
+        except Exception as e:
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+        else:
+            self.queue.complete(job)
+        return True
+
+    def run(self, stop_when_idle=False, stop_event=None):
+        while stop_event is None or not stop_event.is_set():
+            if self.run_once():
+                continue
+            # Jobs waiting out a retry delay are still work to drain
+            if stop_when_idle and not self.queue.jobs("queued"):
+                return
+            time.sleep(INGEST_POLL_SECONDS)
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def start_background_worker(openai_api_key):
+    # One worker thread per Streamlit server process, shared by every session
+    global _background
+    with _background_lock:
+        if _background is None or not _background.is_alive():
+            worker = Worker(openai_api_key=openai_api_key)
+            _background = threading.Thread(target=worker.run, name="ingest-worker", daemon=True)
+            _background.start()
+    return _background
+
+
+def guess_kind(path):
+    # PDFs go through the scanned path, which reads the text layer where there is one
+    return "image" if path.lower().endswith(IMAGE_EXTENSIONS) else "scanned"
+
+
+def _work(stop_when_idle):
+    # Each process opens its own connection rather than inheriting the parent's
+    Worker(JobQueue()).run(stop_when_idle=stop_when_idle)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="files to enqueue before working")
+    parser.add_argument("--kind", choices=["scanned", "text", "image"], help="default: by file extension")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--drain", action="store_true", help="exit once the queue is empty (default with paths)")
+    args = parser.parse_args()
+
+    queue = JobQueue()
+    for path in args.paths:
+        with open(path, "rb") as f:
+            job_id = queue.enqueue(args.kind or guess_kind(path), os.path.basename(path), f.read())
+        print(f"queued {path} as job {job_id}")
+    stop_when_idle = args.drain or bool(args.paths)
+
+    processes = [Process(target=_work, args=(stop_when_idle,)) for _ in range(max(1, args.workers))]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+    for job in queue.jobs():
+        if job["status"] != "done":
+            print(f"job {job['id']} {job['name']}: {job['status']} {job['pages_done']}/{job['pages_total']} "
+                  f"{job['error'] or ''}".rstrip())
+
+
+if __name__ == "__main__":
+    main()
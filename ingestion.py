@@ -0,0 +1,81 @@
+import os
+
+from extraction_cache import content_hash
+from tracing import current_span, traced
+
+# OCR and embedding run on a worker thread (or headless workers) instead of inside the script run
+INGEST_BACKGROUND = os.environ.get("INGEST_BACKGROUND", "1") != "0"
+
+
+class IngestionManager:
+    # Tracks uploaded documents by content hash so each Streamlit rerun only
+    # indexes files that are new and drops the ones the user removed
+    def __init__(self, openai_api_key, background=INGEST_BACKGROUND):
+        # LangChain and FAISS load with the first session rather than with the app
+        from embeddings import get_embedder
+        from vector_index import DocumentIndex
+
+        self.openai_api_key = openai_api_key
+        self.background = background
+        self.index = DocumentIndex(get_embedder(openai_api_key))
+        # doc_id -> job id for uploads still being ingested in the background
+        self.jobs = {}
+
+    @traced("ingest")
+    def sync(self, uploads):
+        # uploads: [(kind, name, data)] with kind "scanned" or "text" for PDFs, "image" for PNG/JPG/GIF.
+        # Returns the documents indexed by this call and the ones removed
+        current = {}
+        for kind, name, data in uploads:
+            current.setdefault(content_hash(data), (kind, name, data))
+
+        removed = [doc_id for doc_id in self.index.documents if doc_id not in current]
+        for doc_id in removed:
+            self.index.remove_document(doc_id)
+        for doc_id in [doc_id for doc_id in self.jobs if doc_id not in current]:
+            del self.jobs[doc_id]
+
+        added = {doc_id: upload for doc_id, upload in current.items() if doc_id not in self.index}
+        if self.background and added:
+            added = self._finished_jobs(added)
+        self._index(added.values())
+        for doc_id in added:
+            self.jobs.pop(doc_id, None)
+
+        current_span().set(added=len(added), removed=len(removed), pending=len(self.jobs),
+                           documents=len(self.index))
+        return list(added), removed
+
+    def _finished_jobs(self, added):
+        # Queues what is new and returns the uploads whose jobs are done; those load from the index store
+        from ingest_worker import start_background_worker
+        from job_queue import get_job_queue
+
+        queue = get_job_queue()
+        start_background_worker(self.openai_api_key)
+        finished = {}
+        for doc_id, upload in added.items():
+            if doc_id not in self.jobs:
+                self.jobs[doc_id] = queue.enqueue(*upload)
+            if queue.get(self.jobs[doc_id])["status"] == "done":
+                finished[doc_id] = upload
+        return finished
+
+    def _index(self, uploads):
+        from ingest_worker import index_function
+
+        by_kind = {}
+        for kind, name, data in uploads:
+            by_kind.setdefault(kind, []).append((name, data))
+        for kind, files in by_kind.items():
+            index_function(kind)(
+                [data for _, data in files], [name for name, _ in files], self.openai_api_key, index=self.index)
+
+    def pending(self):
+        # Queued, running and failed jobs for the current uploads, for progress display
+        if not self.jobs:
+            return []
+        from job_queue import get_job_queue
+
+        queue = get_job_queue()
+        return [queue.get(job_id) for job_id in self.jobs.values()]
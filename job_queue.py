@@ -0,0 +1,187 @@
+import os
+import sqlite3
+import threading
+import time
+
+from extraction_cache import CACHE_DIR, content_hash
+
+# A running job whose heartbeat is older than this is assumed dead and handed to the next worker
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# A failed attempt is retried after this long, doubling with each further attempt
+JOB_RETRY_SECONDS = float(os.environ.get("JOB_RETRY_SECONDS", 30))
+
+_COLUMNS = ("id", "doc_id", "kind", "name", "status", "pages_done", "pages_total", "attempts", "error",
+            "worker", "created", "updated")
+
+
+class JobQueue:
+    # Ingestion jobs in SQLite so the Streamlit app and headless workers can share them.
+    # Uploaded bytes are kept next to the database until the job is done; page-level
+    # checkpoints live in the extraction cache, so a reclaimed job skips finished pages.
+    def __init__(self, path=None, stale_seconds=JOB_STALE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retry_seconds=JOB_RETRY_SECONDS):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "jobs.sqlite3")
+        self.payload_dir = os.path.join(os.path.dirname(path), "uploads")
+        os.makedirs(self.payload_dir, exist_ok=True)
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY, doc_id TEXT, kind TEXT, name TEXT, status TEXT,
+                pages_done INTEGER DEFAULT 0, pages_total INTEGER, attempts INTEGER DEFAULT 0,
+                error TEXT, worker TEXT, heartbeat REAL, created REAL, updated REAL, not_before REAL DEFAULT 0,
+                UNIQUE (doc_id, kind)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+        """)
+        # Queues created before retries were delayed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "not_before" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+
+    def _payload_path(self, doc_id, kind):
+        # One file per job: the same bytes can be queued as more than one kind
+        return os.path.join(self.payload_dir, f"{doc_id}.{kind}")
+
+    def enqueue(self, kind, name, data):
+        # The same upload is one job; re-enqueueing a failed job gives it a fresh set of attempts,
+        # and re-enqueueing a queued, running or finished one changes nothing
+        doc_id = content_hash(data)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status FROM jobs WHERE doc_id = ? AND kind = ?", (doc_id, kind)).fetchone()
+            if row is not None and row[1] != "failed":
+                return row[0]
+            # Written before the row is queued, so a worker never claims a job without its payload
+            path = self._payload_path(doc_id, kind)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self._conn.execute(
+                "INSERT INTO jobs (doc_id, kind, name, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?) "
+                "ON CONFLICT (doc_id, kind) DO UPDATE SET status = 'queued', attempts = 0, error = NULL, "
+                "not_before = 0, updated = excluded.updated WHERE status = 'failed'",
+                (doc_id, kind, name, now, now),
+            )
+            row = self._conn.execute("SELECT id FROM jobs WHERE doc_id = ? AND kind = ?", (doc_id, kind)).fetchone()
+        return row[0]
+
+    def claim(self, worker):
+        # Takes the oldest queued job that is due, or a running one whose worker stopped heartbeating.
+        # A job whose workers kept dying fails once its attempts are used up instead of being reclaimed
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                exhausted = self._conn.execute(
+                    "SELECT id, doc_id, kind FROM jobs WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                    (now - self.stale_seconds, self.max_attempts),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ?",
+                    [(f"worker stopped responding on each of {self.max_attempts} attempts", now, job_id)
+                     for job_id, _, _ in exhausted],
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE (status = 'queued' AND COALESCE(not_before, 0) <= ?) "
+                    "OR (status = 'running' AND heartbeat < ? AND attempts < ?) ORDER BY created LIMIT 1",
+                    (now, now - self.stale_seconds, self.max_attempts),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, updated = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (worker, now, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        for _, doc_id, kind in exhausted:
+            self._remove_payload(doc_id, kind)
+        return self.get(row[0]) if row is not None else None
+
+    def payload(self, job):
+        with open(self._payload_path(job["doc_id"], job["kind"]), "rb") as f:
+            return f.read()
+
+    def heartbeat(self, job_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat = ?, updated = ? WHERE id = ?", (now, now, job_id))
+
+    def progress(self, job_id, pages_done, pages_total):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET pages_done = ?, pages_total = ?, heartbeat = ?, updated = ? WHERE id = ?",
+                (pages_done, pages_total, now, now, job_id),
+            )
+
+    def complete(self, job):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', pages_done = COALESCE(pages_total, pages_done), error = NULL, "
+                "updated = ? WHERE id = ?",
+                (time.time(), job["id"]),
+            )
+        self._remove_payload(job["doc_id"], job["kind"])
+
+    def fail(self, job, error):
+        # Retried after a growing delay until the attempts run out; a job that fails for good
+        # drops the uploaded bytes (enqueueing the upload again writes them anew)
+        now = time.time()
+        failed = job["attempts"] >= self.max_attempts
+        not_before = now if failed else now + self.retry_seconds * 2 ** (job["attempts"] - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, not_before = ?, updated = ? WHERE id = ?",
+                ("failed" if failed else "queued", error, not_before, now, job["id"]),
+            )
+        if failed:
+            self._remove_payload(job["doc_id"], job["kind"])
+
+    def _remove_payload(self, doc_id, kind):
+        try:
+            os.unlink(self._payload_path(doc_id, kind))
+        except FileNotFoundError:
+            pass
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row is not None else None
+
+    def jobs(self, status=None):
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params = ()
+        if status is not None:
+            query += " WHERE status = ?"
+            params = (status,)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created", params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+    return _queue
@@ -0,0 +1,138 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+# Reciprocal rank fusion constant: a chunk at rank r in a ranking scores 1 / (RRF_K + r)
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+# Words and numbers, lowercased; "EBITDA", "FY23" and "2,450" stay intact as terms
+_TERM = re.compile(r"\d+(?:[.,]\d+)*|\w+")
+
+
+def terms(text):
+    return _TERM.findall(text.lower())
+
+
+class Postings(NamedTuple):
+    # One document's inverted index in CSR form: the chunks containing vocab[i] are
+    # chunks[indptr[i]:indptr[i + 1]], with their term frequencies in tfs
+    vocab: dict
+    indptr: np.ndarray
+    chunks: np.ndarray
+    tfs: np.ndarray
+    lengths: np.ndarray
+
+    def lookup(self, term):
+        i = self.vocab.get(term)
+        if i is None:
+            return None, None
+        return self.chunks[self.indptr[i]:self.indptr[i + 1]], self.tfs[self.indptr[i]:self.indptr[i + 1]]
+
+    def document_frequencies(self):
+        return zip(self.vocab, np.diff(self.indptr).tolist())
+
+
+def build_postings(texts):
+    by_term = {}
+    lengths = []
+    for chunk, text in enumerate(texts):
+        counts = Counter(terms(text))
+        lengths.append(sum(counts.values()))
+        for term, count in counts.items():
+            by_term.setdefault(term, []).append((chunk, count))
+    vocab = sorted(by_term)
+    indptr = np.zeros(len(vocab) + 1, dtype="int64")
+    chunks, tfs = [], []
+    for i, term in enumerate(vocab):
+        entries = by_term[term]
+        indptr[i + 1] = indptr[i] + len(entries)
+        chunks.extend(chunk for chunk, _ in entries)
+        tfs.extend(count for _, count in entries)
+    return Postings({term: i for i, term in enumerate(vocab)}, indptr, np.asarray(chunks, dtype="int32"),
+                    np.asarray(tfs, dtype="float32"), np.asarray(lengths, dtype="float32"))
+
+
+def save_postings(path, postings):
+    with open(path, "wb") as f:
+        np.savez(f, vocab=np.asarray(list(postings.vocab), dtype=str), indptr=postings.indptr,
+                 chunks=postings.chunks, tfs=postings.tfs, lengths=postings.lengths)
+
+
+def load_postings(path):
+    with np.load(path) as data:
+        vocab = data["vocab"].tolist()
+        return Postings({term: i for i, term in enumerate(vocab)}, data["indptr"], data["chunks"], data["tfs"],
+                        data["lengths"])
+
+
+class LexicalIndex:
+    # BM25 over every indexed document's chunks. Corpus statistics (chunk count, average
+    # length, document frequencies) are shared, so scores rank the same way as one index
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.documents = {}
+        self.df = Counter()
+        self.chunks = 0
+        self.total_length = 0.0
+
+    def add(self, doc_id, postings):
+        if doc_id in self.documents:
+            return
+        self.documents[doc_id] = postings
+        self.df.update(dict(postings.document_frequencies()))
+        self.chunks += len(postings.lengths)
+        self.total_length += float(postings.lengths.sum())
+
+    def remove(self, doc_id):
+        postings = self.documents.pop(doc_id, None)
+        if postings is None:
+            return
+        self.df.subtract(dict(postings.document_frequencies()))
+        self.chunks -= len(postings.lengths)
+        self.total_length -= float(postings.lengths.sum())
+
+    def idf(self, term):
+        n = self.df.get(term, 0)
+        return math.log(1 + (self.chunks - n + 0.5) / (n + 0.5))
+
+    def search(self, question, k=10):
+        # Per document: [(chunk offset within the document, score)], best first; chunks sharing
+        # no term with the question are left out
+        query = Counter(terms(question))
+        results = {doc_id: [] for doc_id in self.documents}
+        if not query or not self.chunks:
+            return results
+        average_length = self.total_length / self.chunks
+        weights = {term: self.idf(term) * count for term, count in query.items()}
+        for doc_id, postings in self.documents.items():
+            scores = np.zeros(len(postings.lengths), dtype="float32")
+            norms = self.k1 * (1 - self.b + self.b * postings.lengths / average_length)
+            for term, weight in weights.items():
+                chunks, tfs = postings.lookup(term)
+                if chunks is None:
+                    continue
+                scores[chunks] += weight * tfs * (self.k1 + 1) / (tfs + norms[chunks])
+            hits = np.flatnonzero(scores)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k)[:k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            results[doc_id] = [(int(chunk), float(scores[chunk])) for chunk in hits]
+        return results
+
+
+def reciprocal_rank_fusion(rankings, k=10, rrf_k=RRF_K):
+    # rankings: lists of (key, item), best first. Returns [(item, fused score)], best first
+    scores, items = {}, {}
+    for ranking in rankings:
+        for rank, (key, item) in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            items.setdefault(key, item)
+    fused = sorted(scores, key=lambda key: -scores[key])[:k]
+    return [(items[key], scores[key]) for key in fused]
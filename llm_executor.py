@@ -0,0 +1,310 @@
+import contextvars
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from tokenizer import count_tokens
+from tracing import current_span, span, traced
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 3500))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", 90000))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+# Embedding models are rate-limited separately from chat models
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.environ.get("EMBEDDING_REQUESTS_PER_MINUTE", 3000))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.environ.get("EMBEDDING_TOKENS_PER_MINUTE", 1000000))
+
+
+def retryable_errors():
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._available = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # A single request larger than the bucket would wait forever; let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(self.capacity, self._available + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate
+            time.sleep(wait)
+
+
+def estimate_request_tokens(messages, max_tokens=None):
+    # Prompt tokens plus a per-message overhead, plus room for the answer
+    prompt = sum(count_tokens(message["content"]) + 4 for message in messages)
+    return prompt + (max_tokens or 512)
+
+
+def request_key(kind, kwargs):
+    return hashlib.sha256(json.dumps([kind, kwargs], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def default_client():
+    # The executor owns retries, so the SDK's own retry loop is switched off. Calls never
+    # outnumber the executor's slots, so neither do the pooled keep-alive connections
+    import httpx
+    from openai import OpenAI
+
+    from config import get_openai_api_key
+
+    limits = httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+    return OpenAI(api_key=get_openai_api_key(), max_retries=0, http_client=httpx.Client(limits=limits))
+
+
+class LLMExecutor:
+    # The process-wide gateway for OpenAI: every chat completion and embedding request from
+    # every session shares one client (one connection pool), one set of rate limits and one
+    # concurrency bound, and identical requests already in flight share a single upstream call
+    def __init__(self, client_factory=default_client, max_concurrency=LLM_MAX_CONCURRENCY,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 embedding_requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+                 embedding_tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+                 max_retries=LLM_MAX_RETRIES, base_delay=1.0, max_delay=30.0):
+        self.client_factory = client_factory
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.embedding_requests = TokenBucket(embedding_requests_per_minute)
+        self.embedding_tokens = TokenBucket(embedding_tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = deque(maxlen=1000)
+        self._calls_lock = threading.Lock()
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Bounds upstream calls made directly from session threads as well as through the pool
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.client_factory()
+        return self._client
+
+    def _retry_delay(self, attempt, error):
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent retries from landing in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @traced("chat_completion")
+    def chat(self, **kwargs):
+        estimate = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        return self._single_flight(
+            request_key("chat", kwargs),
+            lambda: self._send(self.client.chat.completions.create, self.requests, self.tokens, estimate, kwargs),
+            kwargs["model"],
+        )
+
+    @traced("embedding")
+    def embed(self, texts, model):
+        # One request for the whole batch; vectors come back in input order
+        kwargs = {"model": model, "input": list(texts)}
+        estimate = sum(count_tokens(text) for text in texts)
+        response = self._single_flight(
+            request_key("embed", kwargs),
+            lambda: self._send(self.client.embeddings.create, self.embedding_requests, self.embedding_tokens,
+                               estimate, kwargs),
+            model,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def stream_chat(self, **kwargs):
+        # Yields the answer text as it arrives. Retries happen only before the first token, and
+        # the stream holds a concurrency slot until it is consumed. Streams are never coalesced
+        estimate = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        kwargs = dict(kwargs, stream=True, stream_options={"include_usage": True})
+        retryable = retryable_errors()
+        with span("chat_completion_stream"), self._slots:
+            start = time.perf_counter()
+            attempt, ttft, usage = 0, None, None
+            while True:
+                self.requests.acquire()
+                self.tokens.acquire(estimate)
+                try:
+                    stream = self.client.chat.completions.create(**kwargs)
+                    break
+                except retryable as e:
+                    if attempt >= self.max_retries:
+                        self._record(kwargs["model"], start, attempt, None, e)
+                        raise
+                    time.sleep(self._retry_delay(attempt, e))
+                    attempt += 1
+                except Exception as e:
+                    self._record(kwargs["model"], start, attempt, None, e)
+                    raise
+            try:
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        usage = chunk
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    yield chunk.choices[0].delta.content
+            except GeneratorExit as e:
+                # The consumer stopped reading (a rerun or a closed tab); the call still counts
+                self._record(kwargs["model"], start, attempt, usage, e, ttft)
+                raise
+            except Exception as e:
+                self._record(kwargs["model"], start, attempt, None, e, ttft)
+                raise
+            finally:
+                stream.close()
+            self._record(kwargs["model"], start, attempt, usage, None, ttft)
+
+    def _single_flight(self, key, call, model):
+        # The first caller makes the request; identical callers arriving before it finishes wait for its result
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            start = time.perf_counter()
+            try:
+                return future.result()
+            finally:
+                current_span().set(model=model, coalesced=True)
+                with self._calls_lock:
+                    self.calls.append({"model": model, "seconds": time.perf_counter() - start, "retries": 0,
+                                       "prompt_tokens": None, "completion_tokens": None, "error": None,
+                                       "coalesced": True, "ttft_seconds": None})
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _send(self, create, requests, tokens, estimate, kwargs):
+        start = time.perf_counter()
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            requests.acquire()
+            tokens.acquire(estimate)
+            try:
+                with self._slots:
+                    response = create(**kwargs)
+            except retryable as e:
+                if attempt >= self.max_retries:
+                    self._record(kwargs["model"], start, attempt, None, e)
+                    raise
+                time.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+            except Exception as e:
+                self._record(kwargs["model"], start, attempt, None, e)
+                raise
+            else:
+                self._record(kwargs["model"], start, attempt, response, None)
+                return response
+
+    def _record(self, model, start, retries, completion, error, ttft=None):
+        usage = getattr(completion, "usage", None)
+        current_span().set(model=model, retries=retries, prompt_tokens=getattr(usage, "prompt_tokens", 0),
+                           completion_tokens=getattr(usage, "completion_tokens", 0))
+        if ttft is not None:
+            current_span().set(ttft_seconds=ttft)
+        call = {
+            "model": model,
+            "seconds": time.perf_counter() - start,
+            "retries": retries,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "error": type(error).__name__ if error is not None else None,
+            "coalesced": False,
+            "ttft_seconds": ttft,
+        }
+        with self._calls_lock:
+            self.calls.append(call)
+
+    def map_chat(self, requests):
+        # Results come back in request order; a failed call yields its exception instead of a completion.
+        # Each call runs in a copy of the caller's context so its span nests under the caller's
+        futures = [self._pool.submit(contextvars.copy_context().run, self.chat, **request) for request in requests]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def latency_summary(self):
+        # Calls keep arriving from other sessions; every figure comes from one snapshot
+        with self._calls_lock:
+            calls = list(self.calls)
+        latencies = sorted(call["seconds"] for call in calls)
+        if not latencies:
+            return {"calls": 0}
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        summary = {
+            "calls": len(latencies),
+            "errors": sum(1 for call in calls if call["error"]),
+            "retries": sum(call["retries"] for call in calls),
+            "coalesced": sum(1 for call in calls if call["coalesced"]),
+            "p50_seconds": percentile(0.50),
+            "p95_seconds": percentile(0.95),
+            "max_seconds": latencies[-1],
+        }
+        ttfts = sorted(call["ttft_seconds"] for call in calls if call["ttft_seconds"] is not None)
+        if ttfts:
+            summary["streams"] = len(ttfts)
+            summary["ttft_p50_seconds"] = ttfts[len(ttfts) // 2]
+        return summary
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = LLMExecutor()
+    return _executor
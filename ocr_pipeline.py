@@ -0,0 +1,328 @@
+import logging
+import os
+import re
+import tempfile
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+
+import fitz  # PyMuPDF
+import pytesseract
+from pdf2image import convert_from_path
+from PIL import Image, ImageOps, ImageSequence
+
+from config import process_context
+from extraction_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+# DPI for a Letter/A4-sized page; other page sizes are scaled to a similar pixel size within the bounds
+TESSERACT_CMD = os.environ.get("TESSERACT_CMD", "/usr/bin/tesseract")
+OCR_DPI = int(os.environ.get("OCR_DPI", 200))
+OCR_MIN_DPI = int(os.environ.get("OCR_MIN_DPI", 120))
+OCR_MAX_DPI = int(os.environ.get("OCR_MAX_DPI", 400))
+# Pages whose embedded text layer looks complete skip Tesseract; OCR_ROUTING=0 OCRs every page
+OCR_ROUTING = os.environ.get("OCR_ROUTING", "1") != "0"
+OCR_TEXT_MIN_CHARS = int(os.environ.get("OCR_TEXT_MIN_CHARS", 40))
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+# Pages rasterized per poppler call; 0 means "two pages per worker"
+OCR_WINDOW_SIZE = int(os.environ.get("OCR_WINDOW_SIZE", 0))
+
+# Uploaded images are OCR'd directly; larger sides are scaled down to this (0 keeps full size)
+OCR_IMAGE_MAX_SIDE = int(os.environ.get("OCR_IMAGE_MAX_SIDE", 2500))
+OCR_IMAGE_GRAYSCALE = os.environ.get("OCR_IMAGE_GRAYSCALE", "1") != "0"
+# Tesseract thresholds internally; pre-binarizing helps clean scans but can hurt uneven photos
+OCR_IMAGE_BINARIZE = os.environ.get("OCR_IMAGE_BINARIZE", "0") != "0"
+
+# Bump whenever normalize_ocr_text changes so cached pages are re-extracted
+NORMALIZE_VERSION = 1
+# Bump whenever text_layer_usable or page_dpi changes
+ROUTER_VERSION = 1
+
+_HYPHENATED = re.compile(r"(\w+)-\n(\w+)")
+_SINGLE_NEWLINE = re.compile(r"(?<!\n\s)\n(?!\s\n)")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+def normalize_ocr_text(text):
+    text = _HYPHENATED.sub(r"\1\2", text)
+    text = _SINGLE_NEWLINE.sub(" ", text.strip())
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+def image_coverage(page):
+    # Fraction of the page covered by images, e.g. close to 1.0 for a scan
+    area = abs(page.rect) or 1.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def text_layer_usable(text, coverage=0.0, min_chars=OCR_TEXT_MIN_CHARS):
+    visible = [c for c in text if not c.isspace()]
+    # A scan with a stamped header or page number must not pass on those few characters
+    if len(visible) < (min_chars * 5 if coverage >= 0.5 else min_chars):
+        return False
+    # Fonts without a usable encoding come out as replacement or control characters
+    garbled = sum(1 for c in visible if c == "\ufffd" or unicodedata.category(c)[0] == "C")
+    if garbled > 0.02 * len(visible):
+        return False
+    words = text.split()
+    return sum(1 for word in words if any(c.isalnum() for c in word)) >= 0.7 * len(words)
+
+
+_tesseract_configured = False
+
+
+def configure_tesseract():
+    # Runs before the first page goes to Tesseract, so documents whose pages all have a usable
+    # text layer (and text-only deployments) never need tessdata
+    global _tesseract_configured
+    if _tesseract_configured:
+        return
+    tessdata = os.environ.get("TESSDATA_PREFIX")
+    if tessdata and not os.path.exists(os.path.join(tessdata, "eng.traineddata")):
+        raise FileNotFoundError(f"eng.traineddata is missing from TESSDATA_PREFIX ({tessdata})")
+    logger.info("Tesseract %s with tessdata from %s", TESSERACT_CMD, tessdata or "its default location")
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    _tesseract_configured = True
+
+
+def _init_worker(tesseract_cmd, tessdata_prefix):
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if tessdata_prefix:
+        os.environ["TESSDATA_PREFIX"] = tessdata_prefix
+
+
+def _ocr_page(image):
+    return normalize_ocr_text(pytesseract.image_to_string(image))
+
+
+def otsu_threshold(gray):
+    # The grey level that best separates ink from paper (maximum between-class variance)
+    histogram = gray.histogram()
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        background_mean = weighted_background / background
+        foreground_mean = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def preprocess_image(image, max_side=OCR_IMAGE_MAX_SIDE, grayscale=OCR_IMAGE_GRAYSCALE,
+                     binarize=OCR_IMAGE_BINARIZE):
+    # Phone photos carry their rotation in EXIF; transparent areas become white paper
+    image = ImageOps.exif_transpose(image)
+    if "A" in image.getbands() or image.mode == "P":
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if grayscale or binarize:
+        image = image.convert("L")
+    if binarize:
+        threshold = otsu_threshold(image)
+        image = image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+    return image
+
+
+def _ocr_image(image_bytes, max_side, grayscale, binarize):
+    # One text per frame, so multi-frame GIFs and TIFFs keep their page numbers
+    with Image.open(BytesIO(image_bytes)) as image:
+        return [_ocr_page(preprocess_image(frame.copy(), max_side, grayscale, binarize))
+                for frame in ImageSequence.Iterator(image)]
+
+
+class OCRPipeline:
+    def __init__(self, dpi=OCR_DPI, workers=OCR_WORKERS, window_size=OCR_WINDOW_SIZE,
+                 image_max_side=OCR_IMAGE_MAX_SIDE, image_grayscale=OCR_IMAGE_GRAYSCALE,
+                 image_binarize=OCR_IMAGE_BINARIZE, routing=OCR_ROUTING, min_dpi=OCR_MIN_DPI,
+                 max_dpi=OCR_MAX_DPI, min_text_chars=OCR_TEXT_MIN_CHARS):
+        self.dpi = dpi
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.routing = routing
+        self.min_text_chars = min_text_chars
+        self.workers = max(1, workers)
+        self.window_size = window_size or max(2 * self.workers, 4)
+        self.image_max_side = image_max_side
+        self.image_grayscale = image_grayscale
+        self.image_binarize = image_binarize
+        self.last_stats = {}
+
+    def settings(self):
+        # Everything that changes the OCR output belongs in the cache key
+        return {
+            "extractor": "tesseract",
+            "tessdata": os.environ.get("TESSDATA_PREFIX", ""),
+            "dpi": [self.dpi, self.min_dpi, self.max_dpi],
+            "router": [ROUTER_VERSION, self.min_text_chars] if self.routing else None,
+            "normalize": NORMALIZE_VERSION,
+        }
+
+    def page_dpi(self, rect):
+        # Same pixel size as a Letter page at self.dpi, rounded so neighbouring pages share a window
+        long_side = max(rect.width, rect.height) or 792
+        dpi = self.dpi * 792 / long_side
+        return int(min(self.max_dpi, max(self.min_dpi, round(dpi / 10) * 10)))
+
+    def image_settings(self):
+        return {
+            "extractor": "tesseract-image",
+            "tessdata": os.environ.get("TESSDATA_PREFIX", ""),
+            "max_side": self.image_max_side,
+            "grayscale": self.image_grayscale,
+            "binarize": self.image_binarize,
+            "normalize": NORMALIZE_VERSION,
+        }
+
+    def _iter_windows(self, pdf_path, page_dpis):
+        # Windows are runs of consecutive page numbers at one DPI so each one is a single poppler call
+        run, run_dpi = [], None
+        for page, dpi in sorted(page_dpis.items()):
+            if run and (page != run[-1] + 1 or dpi != run_dpi or len(run) == self.window_size):
+                yield run, convert_from_path(pdf_path, dpi=run_dpi, first_page=run[0], last_page=run[-1])
+                run = []
+            run.append(page)
+            run_dpi = dpi
+        if run:
+            yield run, convert_from_path(pdf_path, dpi=run_dpi, first_page=run[0], last_page=run[-1])
+
+    def _ocr_windows(self, windows):
+        if self.workers == 1:
+            for pages, images in windows:
+                yield pages, [_ocr_page(image) for image in images]
+            return
+
+        initargs = (pytesseract.pytesseract.tesseract_cmd, os.environ.get("TESSDATA_PREFIX"))
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=process_context(), initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            # Keep at most two windows alive: the one being OCR'd and the one being rasterized
+            pending_pages, pending = [], []
+            for pages, images in windows:
+                futures = [pool.submit(_ocr_page, image) for image in images]
+                del images
+                yield pending_pages, [future.result() for future in pending]
+                pending_pages, pending = pages, futures
+            yield pending_pages, [future.result() for future in pending]
+
+    def run(self, pdf_bytes, cache=None, progress=None):
+        # progress(pages_done, page_count) is called as pages complete, cached ones included
+        start = time.perf_counter()
+        settings = self.settings()
+        doc_hash = content_hash(pdf_bytes) if cache is not None else None
+
+        if cache is not None:
+            cached = cache.get_document(doc_hash, settings)
+            if cached is not None:
+                self._record_stats(len(cached), 0, start)
+                return cached
+
+        done = cache.get_pages(doc_hash, settings) if cache is not None else {}
+        text_pages = 0
+        to_ocr = {}
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page_count = doc.page_count
+            for page in range(1, page_count + 1):
+                if page in done:
+                    continue
+                fitz_page = doc.load_page(page - 1)
+                if self.routing:
+                    text = fitz_page.get_text()
+                    if text_layer_usable(text, image_coverage(fitz_page), self.min_text_chars):
+                        done[page] = normalize_ocr_text(text)
+                        text_pages += 1
+                        if cache is not None:
+                            cache.put_page(doc_hash, settings, page, done[page])
+                        continue
+                to_ocr[page] = self.page_dpi(fitz_page.rect)
+
+        if progress is not None:
+            progress(len(done), page_count)
+        if to_ocr:
+            configure_tesseract()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
+                temp_pdf.write(pdf_bytes)
+                temp_pdf_path = temp_pdf.name
+            try:
+                for pages, texts in self._ocr_windows(self._iter_windows(temp_pdf_path, to_ocr)):
+                    for page, text in zip(pages, texts):
+                        done[page] = text
+                        if cache is not None:
+                            cache.put_page(doc_hash, settings, page, text)
+                    if progress is not None and pages:
+                        progress(len(done), page_count)
+            finally:
+                os.unlink(temp_pdf_path)
+
+        if cache is not None:
+            cache.set_page_count(doc_hash, settings, page_count)
+
+        output = [done.get(page, "") for page in range(1, page_count + 1)]
+        self._record_stats(len(output), len(to_ocr), start, text_pages)
+        return output
+
+    def run_images(self, images, cache=None, progress=None):
+        # images: raw PNG/JPG/GIF bytes, OCR'd as they are without a PDF round trip.
+        # Returns one list of page texts per image
+        start = time.perf_counter()
+        settings = self.image_settings()
+        hashes = [content_hash(image) for image in images] if cache is not None else [None] * len(images)
+        outputs = [cache.get_document(doc_hash, settings) if cache is not None else None for doc_hash in hashes]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+
+        if missing:
+            configure_tesseract()
+        options = (self.image_max_side, self.image_grayscale, self.image_binarize)
+        if self.workers == 1 or len(missing) < 2:
+            texts = (_ocr_image(images[i], *options) for i in missing)
+            self._store_images(outputs, missing, texts, hashes, settings, cache, progress)
+        else:
+            initargs = (pytesseract.pytesseract.tesseract_cmd, os.environ.get("TESSDATA_PREFIX"))
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(missing)), mp_context=process_context(),
+                                     initializer=_init_worker, initargs=initargs) as pool:
+                texts = pool.map(_ocr_image, [images[i] for i in missing], *(repeat(option) for option in options))
+                self._store_images(outputs, missing, texts, hashes, settings, cache, progress)
+
+        ocr_pages = sum(len(outputs[i]) for i in missing)
+        self._record_stats(sum(len(output) for output in outputs), ocr_pages, start)
+        return outputs
+
+    def _store_images(self, outputs, missing, texts, hashes, settings, cache, progress):
+        # Progress for images counts whole images rather than pages
+        done = len(outputs) - len(missing)
+        if progress is not None:
+            progress(done, len(outputs))
+        for i, pages in zip(missing, texts):
+            outputs[i] = pages
+            if cache is not None:
+                cache.put_document(hashes[i], settings, pages)
+            done += 1
+            if progress is not None:
+                progress(done, len(outputs))
+
+    def _record_stats(self, pages, ocr_pages, start, text_pages=0):
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "pages": pages,
+            "ocr_pages": ocr_pages,
+            "text_pages": text_pages,
+            "cached_pages": pages - ocr_pages - text_pages,
+            "seconds": elapsed,
+            "pages_per_sec": pages / elapsed if elapsed else 0.0,
+        }
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Caches, indexes and queues default to a directory fixed at import time; keep test runs out of .rag_cache
+os.environ.setdefault("RAG_CACHE_DIR", tempfile.mkdtemp(prefix="rag-tests-"))
+os.environ.setdefault("EMBEDDING_PROVIDER", "hash")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
@@ -0,0 +1,97 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+class Clock:
+    # A second passes on every call, so stores and lookups are ordered; skip() jumps ahead
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+    def skip(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache, "time", clock)
+    return clock
+
+
+def make_cache(**options):
+    return SemanticAnswerCache(":memory:", **{"threshold": 0.95, "ttl": 3600, **options})
+
+
+def test_similar_question_hits_within_the_threshold():
+    cache = make_cache()
+    cache.store("docs", "What was the revenue?", [1.0, 0.0, 0.0], {"answer": "410 million"})
+    # Lengths do not matter, only direction
+    assert cache.lookup("docs", [5.0, 0.2, 0.0]) == {"answer": "410 million"}
+    assert cache.lookup("docs", [0.9, 0.44, 0.0]) is None
+    assert cache.lookup("other docs", [1.0, 0.0, 0.0]) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "entries": 1}
+
+
+def test_closest_stored_question_wins():
+    cache = make_cache(threshold=0.5)
+    cache.store("docs", "revenue", [1.0, 0.0], "revenue answer")
+    cache.store("docs", "revenue growth", [0.8, 0.6], "growth answer")
+    assert cache.lookup("docs", [0.7, 0.7]) == "growth answer"
+    assert cache.lookup("docs", [1.0, 0.1]) == "revenue answer"
+
+
+def test_expired_answers_are_not_served_and_are_dropped(clock):
+    cache = make_cache(ttl=100)
+    cache.store("docs", "old question", [1.0, 0.0], "old answer")
+    assert cache.lookup("docs", [1.0, 0.0]) == "old answer"
+    clock.skip(100)
+    assert cache.lookup("docs", [1.0, 0.0]) is None
+    cache.store("docs", "new question", [0.0, 1.0], "new answer")
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_answers_are_trimmed(clock):
+    cache = make_cache(max_entries=2)
+    cache.store("docs", "a", [1.0, 0.0, 0.0], "A")
+    cache.store("docs", "b", [0.0, 1.0, 0.0], "B")
+    # Reading "a" makes "b" the least recently used
+    assert cache.lookup("docs", [1.0, 0.0, 0.0]) == "A"
+    cache.store("docs", "c", [0.0, 0.0, 1.0], "C")
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("docs", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("docs", [1.0, 0.0, 0.0]) == "A"
+    assert cache.lookup("docs", [0.0, 0.0, 1.0]) == "C"
+
+
+def test_single_pass_answers_are_skipped_when_per_document_answers_are_required():
+    cache = make_cache()
+    cache.store("docs", "What was the revenue?", [1.0, 0.0], "document-wise", individual=True)
+    cache.store("docs", "What was revenue?", [1.0, 0.01], "single pass", individual=False)
+    # The single-pass answer is closer but cannot be shown per document, and it does not count as a hit
+    assert cache.lookup("docs", [1.0, 0.01], require_individual=True) == "document-wise"
+    assert cache.lookup("docs", [1.0, 0.01]) == "single pass"
+    cache.store("summaries", "What was revenue?", [1.0, 0.0], "single pass", individual=False)
+    assert cache.lookup("summaries", [1.0, 0.0], require_individual=True) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_rows_from_before_the_individual_column_are_only_served_to_summaries(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE answers (id INTEGER PRIMARY KEY, doc_set TEXT, question TEXT, "
+                     "embedding BLOB, answer TEXT, created REAL, last_access REAL)")
+        conn.execute("INSERT INTO answers VALUES (1, 'docs', 'q', ?, '\"old\"', ?, ?)",
+                     (np.asarray([1.0, 0.0], dtype="float32").tobytes(), time.time(), time.time()))
+    cache = SemanticAnswerCache(path)
+    assert cache.lookup("docs", [1.0, 0.0], require_individual=True) is None
+    assert cache.lookup("docs", [1.0, 0.0]) == "old"
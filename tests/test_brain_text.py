@@ -0,0 +1,56 @@
+import random
+import re
+
+import pytest
+
+import brain_text
+from benchmarks.bench_text_extract import make_pdf
+from brain_text import extract_pages, normalize_page
+
+PIECES = ["FY2023", "$410.5", "ex-\npenses", "Q3", "revenue", "12%", "-\n", "-", "(1)", "a", "7",
+          " ", "  ", "\n", "\n\n", "\t", "\x0c", "\x1c", "\xa0", "é", "日本", "\x00"]
+
+
+def seven_passes(text):
+    # The whole-document normalization brain_text.parse_pdf used to run, except that a hyphen
+    # join no longer consumes the next word's letters, so "ex-\npensesex-\npenses" joins twice
+    text = re.sub(r"(?<=\w)-\n(?=\w)", "", text)
+    text = re.sub(r"(?<!\n\s)\n(?!\s\n)", " ", text.strip())
+    text = re.sub(r"\n\s*\n", "\n\n", text)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"[^\x20-\x7E]", "", text)
+    text = re.sub(r"(\D)(\d)", r"\1 \2", text)
+    text = re.sub(r"(\d)(\D)", r"\1 \2", text)
+    return text
+
+
+def test_matches_the_old_passes_without_doubled_spaces():
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 30)))
+        assert normalize_page(text) == " ".join(seven_passes(text).split()), text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Operating ex-\npenses fell", "Operating expenses fell"),
+    ("cost- \nbase", "cost- base"),
+    ("FY2023 revenue", "FY 2023 revenue"),
+    ("$410.5m", "$ 410 . 5 m"),
+    ("page 12", "page 12"),
+    # Digits and letters brought together by a removal are still separated
+    ("FY2023-\nFY", "FY 2023 FY"),
+    ("Q\x003", "Q 3"),
+    ("caf\xe9 \n\t au\x1clait\xa0", "caf au lait"),
+    ("\x0c\n", ""),
+])
+def test_normalize_page(text, expected):
+    assert normalize_page(text) == expected
+
+
+def test_page_ranges_extracted_in_worker_processes_match_serial(monkeypatch):
+    monkeypatch.setattr(brain_text, "TEXT_EXTRACT_PARALLEL_MIN_PAGES", 2)
+    pdf = make_pdf(5)
+    progress = []
+    pages = extract_pages(pdf, workers=2, progress=lambda done, total: progress.append((done, total)))
+    assert pages == extract_pages(pdf, workers=1)
+    assert progress == [(3, 5), (5, 5)]
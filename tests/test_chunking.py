@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+import tokenizer
+from chunking import TokenChunker
+from tokenizer import count_tokens, token_offsets
+
+PIECES = ["revenue", "Zephyr-7", "12.5", "(net)", "café", "日本語", "naïve", " ", "  ", "\n", "\t",
+          "\x1c", "\x1d", "\x1e", "\x1f", " ", ",", ".", "—", "%", "_id", "x2"]
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # The approximate tokenizer is what runs offline; test it whether or not tiktoken is installed
+    monkeypatch.setattr(tokenizer, "_encoding", False)
+
+
+def random_texts(count, ascii_only):
+    rng = random.Random(0)
+    pieces = [piece for piece in PIECES if piece.isascii()] if ascii_only else PIECES
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 80))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("ascii_only", [True, False])
+def test_strided_offsets_match_every_offset(ascii_only):
+    for text in random_texts(300, ascii_only):
+        expected = token_offsets(text)
+        assert count_tokens(text) == len(expected)
+        for stride in (2, 3, 7, 16):
+            offsets = token_offsets(text, stride)
+            assert len(offsets) == len(expected)
+            assert [offsets[i] for i in range(len(offsets))] == expected, (text, stride)
+
+
+def test_separator_controls_are_whitespace_for_ascii_and_unicode_text():
+    ascii_text = "net\x1crevenue\x1f grew"
+    assert token_offsets(ascii_text) == [0, 3, 11]
+    assert token_offsets(ascii_text + " é") == [0, 3, 11, 17]
+
+
+def chunk_texts(chunker, text):
+    return [text[record.start:record.end] for record in chunker.chunk_page("doc", 1, text)]
+
+
+def test_windows_overlap_and_the_last_one_is_pulled_back():
+    words = [f"w{i}" for i in range(40)]
+    chunks = chunk_texts(TokenChunker(chunk_tokens=10, overlap_tokens=3), " ".join(words))
+    starts = [0, 7, 14, 21, 28, 30]
+    assert chunks == [" ".join(words[start:start + 10]) for start in starts]
+
+
+def test_no_extra_window_when_the_last_one_ends_at_the_page_end():
+    words = [f"w{i}" for i in range(24)]
+    chunks = chunk_texts(TokenChunker(chunk_tokens=10, overlap_tokens=3), " ".join(words))
+    assert chunks == [" ".join(words[start:start + 10]) for start in (0, 7, 14)]
+
+
+def test_short_and_blank_pages():
+    chunker = TokenChunker(chunk_tokens=10, overlap_tokens=3)
+    assert chunk_texts(chunker, "  Net revenue grew.  ") == ["Net revenue grew."]
+    assert chunk_texts(chunker, " \n\t ") == []
+    records = list(chunker.chunk_pages("doc", ["first page", "", "third page"]))
+    assert [(record.page, record.chunk) for record in records] == [(1, 0), (3, 0)]
+
+
+def test_overlap_must_be_smaller_than_the_window():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_tokens=10, overlap_tokens=10)
@@ -0,0 +1,100 @@
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import comparison
+from comparison import NO_INFORMATION, compare_responses_via_api, parse_key_points_extraction
+from tracing import get_tracer
+
+KEY_POINTS = ["Revenue", "Net Income"]
+
+
+def completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeExecutor:
+    # map_chat answers per document from replies; chat answers the key point prompt and the fallbacks
+    def __init__(self, replies, fallback=None):
+        self.replies = replies
+        self.fallback = fallback
+        self.chats = []
+
+    def map_chat(self, requests):
+        assert len(requests) == len(self.replies)
+        return self.replies
+
+    def chat(self, **request):
+        prompt = request["messages"][-1]["content"]
+        self.chats.append(prompt)
+        if "comma-separated format" in prompt:
+            return completion(", ".join(KEY_POINTS))
+        if isinstance(self.fallback, Exception):
+            raise self.fallback
+        return completion(self.fallback)
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    def install(replies, fallback=None):
+        fake = FakeExecutor(replies, fallback)
+        monkeypatch.setattr(comparison, "get_executor", lambda: fake)
+        monkeypatch.setattr(comparison, "retrieve_packed",
+                            lambda *args, **kwargs: [SimpleNamespace(text=f"extract {i}") for i in range(len(replies))])
+        return fake
+
+    return install
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "http://stub/v1/chat/completions")
+    response = httpx.Response(429, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def last_span():
+    return [span for span in get_tracer().recent() if span["name"] == "compare_responses_via_api"][-1]
+
+
+def test_one_structured_call_per_document(executor):
+    fake = executor([completion(json.dumps({"revenue": "410 million", "Net Income": {"fy": 12}})),
+                     completion(json.dumps({"Revenue": ""}))])
+    table = compare_responses_via_api("How did they do?", None, ["a.pdf", "b.pdf"])
+    assert list(table["Revenue"]) == ["410 million", NO_INFORMATION]
+    assert list(table["Net Income"]) == ['{"fy": 12}', NO_INFORMATION]
+    assert len(fake.chats) == 1
+    assert last_span()["fallbacks"] == 0
+
+
+def test_unusable_reply_falls_back_per_key_point(executor):
+    fake = executor([completion("Revenue was 410 million."), completion(json.dumps({"Revenue": "198 million"}))],
+                    fallback="From the fallback.")
+    table = compare_responses_via_api("How did they do?", None, ["a.pdf", "b.pdf"])
+    assert list(table["Revenue"]) == ["From the fallback.", "198 million"]
+    assert len(fake.chats) == 1 + len(KEY_POINTS)
+    assert last_span()["fallbacks"] == 1
+
+
+def test_failed_request_is_not_retried_per_key_point(executor):
+    fake = executor([rate_limit_error(), completion(json.dumps({"Revenue": "198 million", "Net Income": "9"}))])
+    table = compare_responses_via_api("How did they do?", None, ["a.pdf", "b.pdf"])
+    assert table["Revenue"][0].startswith(NO_INFORMATION) and "RateLimitError" in table["Revenue"][0]
+    assert list(table["Net Income"])[1] == "9"
+    assert len(fake.chats) == 1
+    span = last_span()
+    assert (span["fallbacks"], span["failed_requests"]) == (0, 1)
+
+
+def test_failing_fallback_does_not_escape(executor):
+    executor([completion("not json"), completion("not json either")], fallback=rate_limit_error())
+    table = compare_responses_via_api("How did they do?", None, ["a.pdf", "b.pdf"])
+    assert all("RateLimitError" in cell for cell in table["Revenue"])
+    assert last_span()["failed_requests"] == 2 * len(KEY_POINTS)
+
+
+def test_parse_rejects_non_objects():
+    assert parse_key_points_extraction("[1, 2]", KEY_POINTS) is None
+    assert parse_key_points_extraction(None, KEY_POINTS) is None
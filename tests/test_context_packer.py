@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import tokenizer
+from context_packer import _merge_spans, pack_context
+from tokenizer import count_tokens
+
+WORDS = [f"w{i}" for i in range(100)]
+PAGE = " ".join(WORDS)
+
+
+@pytest.fixture(autouse=True)
+def approximate_tokens(monkeypatch):
+    # Token counts below are word counts, which holds for the offline approximate tokenizer
+    monkeypatch.setattr(tokenizer, "_encoding", False)
+
+
+def chunk(first, last, page=1, doc_id="doc"):
+    # Words [first, last) of PAGE as a chunk carrying its character span, like ChunkDocuments
+    start = len(" ".join(WORDS[:first])) + (1 if first else 0)
+    end = len(" ".join(WORDS[:last]))
+    return Document(page_content=PAGE[start:end],
+                    metadata={"doc_id": doc_id, "page": page, "start": start, "end": end})
+
+
+def words(first, last):
+    return " ".join(WORDS[first:last])
+
+
+def pack(docs, budget):
+    # Orthogonal vectors and falling relevance: MMR keeps the ranked order
+    return pack_context(docs, np.eye(len(docs)), None, budget=budget,
+                        relevance=np.linspace(1, 0.5, len(docs)))
+
+
+def test_overlapping_chunks_are_stitched_into_one_passage():
+    passages = _merge_spans([chunk(10, 20), chunk(40, 50), chunk(15, 25), chunk(20, 30), chunk(16, 18)])
+    assert passages == [words(10, 30), words(40, 50)]
+
+
+def test_passages_keep_the_rank_of_their_best_chunk():
+    passages = _merge_spans([chunk(40, 50), chunk(0, 10, page=2), chunk(5, 15), chunk(0, 8)])
+    assert passages == [words(40, 50), words(0, 10), words(0, 15)]
+
+
+def test_chunks_without_offsets_pass_through():
+    plain = Document(page_content="from an older index", metadata={"doc_id": "doc", "page": 1})
+    assert _merge_spans([plain, plain]) == ["from an older index"] * 2
+
+
+def test_overlap_is_only_paid_for_once():
+    docs = [chunk(0, 10), chunk(5, 15), chunk(50, 60)]
+    packed = pack(docs, budget=15)
+    # The second chunk costs its 5 new tokens, leaving no room for the third
+    assert (packed.text, packed.tokens, packed.chunks) == (words(0, 15), 15, 2)
+    assert packed.baseline_tokens == count_tokens("\n".join(doc.page_content for doc in docs))
+
+
+def test_budget_skips_chunks_that_do_not_fit():
+    docs = [chunk(0, 10), chunk(20, 40), chunk(50, 55)]
+    packed = pack(docs, budget=16)
+    assert packed.text == words(0, 10) + "\n" + words(50, 55)
+    assert packed.tokens <= 16
+    assert pack(docs, budget=4).chunks == 0
+
+
+def test_nothing_to_pack():
+    packed = pack_context([], [], [1.0, 0.0])
+    assert (packed.text, packed.tokens, packed.chunks) == ("", 0, 0)
@@ -0,0 +1,71 @@
+from embeddings import CachedEmbeddings, EmbeddingStore, HashEmbeddings
+
+
+class CountingEmbeddings(HashEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.documents = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return super().embed_query(text)
+
+
+def make_embedder(store=None, batch_size=512):
+    inner = CountingEmbeddings()
+    store = store if store is not None else EmbeddingStore(":memory:")
+    return inner, CachedEmbeddings(inner, inner.model, store=store, batch_size=batch_size)
+
+
+def test_duplicate_texts_are_embedded_once():
+    inner, embedder = make_embedder()
+    vectors = embedder.embed_documents(["revenue", "margin", "revenue"])
+    assert inner.documents == [["revenue", "margin"]]
+    assert vectors[0] == vectors[2] == HashEmbeddings().embed_query("revenue")
+    assert embedder.stats == {"requested": 3, "unique": 2, "cached": 0, "embedded": 2,
+                              "queries": 0, "queries_cached": 0}
+
+
+def test_stored_vectors_are_hits_for_a_new_embedder():
+    store = EmbeddingStore(":memory:")
+    _, first = make_embedder(store)
+    first.embed_documents(["revenue", "margin"])
+
+    inner, second = make_embedder(store)
+    vectors = second.embed_documents(["margin", "cash flow", "revenue"])
+    assert inner.documents == [["cash flow"]]
+    assert vectors == HashEmbeddings().embed_documents(["margin", "cash flow", "revenue"])
+    assert second.stats["cached"] == 2
+    assert second.stats["embedded"] == 1
+
+
+def test_misses_are_sent_in_batches():
+    inner, embedder = make_embedder(batch_size=2)
+    embedder.embed_documents([f"page {i}" for i in range(5)])
+    assert [len(batch) for batch in inner.documents] == [2, 2, 1]
+
+
+def test_question_is_embedded_once():
+    inner, embedder = make_embedder()
+    first = embedder.embed_query("What was the revenue?")
+    second = embedder.embed_query("What was the revenue?")
+    assert first == second
+    assert inner.queries == ["What was the revenue?"]
+    assert embedder.stats["queries"] == 2
+    assert embedder.stats["queries_cached"] == 1
+
+
+def test_question_vector_survives_in_the_store():
+    store = EmbeddingStore(":memory:")
+    _, first = make_embedder(store)
+    first.embed_query("What was the revenue?")
+
+    inner, second = make_embedder(store)
+    second.embed_query("What was the revenue?")
+    assert inner.queries == []
+    assert second.stats["queries_cached"] == 1
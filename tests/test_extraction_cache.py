@@ -0,0 +1,60 @@
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+import extraction_cache
+from extraction_cache import ExtractionCache
+
+SETTINGS = {"extractor": "test", "version": 1}
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Every write and read gets a later timestamp, so LRU order is the order of the calls
+    ticks = count(1)
+    monkeypatch.setattr(extraction_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def test_replaced_page_is_counted_once():
+    cache = ExtractionCache(":memory:", max_bytes=15)
+    cache.put_page("a", SETTINGS, 1, "x" * 10)
+    cache.put_page("a", SETTINGS, 1, "y" * 10)
+    assert cache.get_pages("a", SETTINGS) == {1: "y" * 10}
+    # Without eviction to recount it, the running total has to drop the replaced size itself
+    cache.put_page("a", SETTINGS, 1, "z" * 4)
+    assert cache._total == 4
+
+
+def test_least_recently_used_pages_are_evicted():
+    cache = ExtractionCache(":memory:", max_bytes=25)
+    cache.put_document("old", SETTINGS, ["x" * 10])
+    cache.put_document("read", SETTINGS, ["x" * 10])
+    # Reading a document makes it the most recently used
+    assert cache.get_pages("old", SETTINGS) == {1: "x" * 10}
+    cache.put_document("new", SETTINGS, ["x" * 10])
+    assert cache.get_document("read", SETTINGS) is None
+    assert cache.get_document("old", SETTINGS) == ["x" * 10]
+    assert cache.get_document("new", SETTINGS) == ["x" * 10]
+    assert cache._total == 20
+
+
+def test_partial_document_is_topped_up():
+    cache = ExtractionCache(":memory:")
+    cache.put_page("a", SETTINGS, 1, "first")
+    cache.put_page("a", SETTINGS, 3, "third")
+    cache.set_page_count("a", SETTINGS, 3)
+    # Only a complete document is a hit; the pages done so far are still there to resume from
+    assert cache.get_document("a", SETTINGS) is None
+    assert cache.get_pages("a", SETTINGS) == {1: "first", 3: "third"}
+    cache.put_page("a", SETTINGS, 2, "")
+    assert cache.get_document("a", SETTINGS) == ["first", "", "third"]
+
+
+def test_settings_are_part_of_the_key(tmp_path):
+    path = str(tmp_path / "extraction.sqlite3")
+    ExtractionCache(path).put_document("a", SETTINGS, ["page"])
+    reopened = ExtractionCache(path)
+    assert reopened.get_document("a", SETTINGS) == ["page"]
+    assert reopened.get_document("a", {**SETTINGS, "version": 2}) is None
+    assert reopened._total == 4
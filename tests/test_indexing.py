@@ -0,0 +1,61 @@
+import pytest
+
+import indexing
+from extraction_cache import content_hash
+from index_store import IndexStore
+from indexing import index_files
+
+EXTRACTION = {"extractor": "test"}
+FILES = {
+    b"annual": ["Net revenue grew to 410 million.", "Operating margin improved to 18 percent."],
+    b"interim": ["Free cash flow covered the dividend twice."],
+}
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    store = IndexStore(str(tmp_path))
+    monkeypatch.setattr(indexing, "get_index_store", lambda: store)
+    return store
+
+
+class Extractor:
+    def __init__(self):
+        self.extracted = []
+
+    def __call__(self, files, names):
+        self.extracted.extend(names)
+        return [FILES[data] for data in files]
+
+
+def test_new_files_are_extracted_and_stored():
+    extract = Extractor()
+    index = index_files(list(FILES), ["annual.pdf", "interim.pdf"], "stub", None, EXTRACTION, extract)
+    assert extract.extracted == ["annual.pdf", "interim.pdf"]
+    assert index.document_names() == ["annual.pdf", "interim.pdf"]
+    assert "Free cash flow" in index.search("free cash flow", k=1)[content_hash(b"interim")][0].page_content
+
+
+def test_indexed_and_stored_files_are_not_extracted_again():
+    index = index_files([b"annual"], ["annual.pdf"], "stub", None, EXTRACTION, Extractor())
+    extract = Extractor()
+    assert index_files(list(FILES), ["annual.pdf", "interim.pdf"], "stub", index, EXTRACTION, extract) is index
+    assert extract.extracted == ["interim.pdf"]
+
+    # A new session loads both from the store
+    extract = Extractor()
+    index = index_files(list(FILES), ["annual.pdf", "interim.pdf"], "stub", None, EXTRACTION, extract)
+    assert extract.extracted == []
+    assert len(index) == 2
+
+    # Other extraction settings are a different store entry
+    index_files([b"annual"], ["annual.pdf"], "stub", None, {"extractor": "other"}, extract)
+    assert extract.extracted == ["annual.pdf"]
+
+
+def test_metadata_is_added_to_every_chunk():
+    index = index_files([b"annual"], ["annual.pdf"], "stub", None, EXTRACTION, Extractor(),
+                        metadata=lambda data: {"source_type": "image", "bytes": len(data)})
+    docs = index.search("revenue margin", k=2)[content_hash(b"annual")]
+    assert len(docs) == 2
+    assert all(doc.metadata["source_type"] == "image" and doc.metadata["bytes"] == 6 for doc in docs)
@@ -0,0 +1,123 @@
+import os
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), stale_seconds=60, max_attempts=2, retry_seconds=0)
+
+
+def make_stale(queue, job_id):
+    with queue._lock:
+        queue._conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time() - 3600, job_id))
+
+
+def test_same_upload_is_one_job(queue):
+    first = queue.enqueue("text", "report.pdf", b"%PDF report")
+    assert queue.enqueue("text", "report.pdf", b"%PDF report") == first
+    assert queue.enqueue("image", "report.pdf", b"%PDF report") != first
+    assert len(queue.jobs()) == 2
+
+
+def test_claim_takes_the_oldest_queued_job(queue):
+    first = queue.enqueue("text", "a.pdf", b"a")
+    queue.enqueue("text", "b.pdf", b"b")
+    job = queue.claim("worker-1")
+    assert job["id"] == first
+    assert job["status"] == "running"
+    assert job["worker"] == "worker-1"
+    assert job["attempts"] == 1
+    assert queue.payload(job) == b"a"
+    assert queue.claim("worker-2")["name"] == "b.pdf"
+    assert queue.claim("worker-3") is None
+
+
+def test_each_kind_keeps_its_own_payload(queue):
+    queue.enqueue("text", "report.pdf", b"same bytes")
+    queue.enqueue("ocr", "report.pdf", b"same bytes")
+    first = queue.claim("worker")
+    queue.complete(first)
+    second = queue.claim("worker")
+    assert queue.payload(second) == b"same bytes"
+    queue.complete(second)
+    assert os.listdir(queue.payload_dir) == []
+
+
+def test_complete_records_progress_and_removes_the_payload(queue):
+    queue.enqueue("text", "a.pdf", b"a")
+    job = queue.claim("worker")
+    queue.progress(job["id"], 3, 10)
+    assert queue.get(job["id"])["pages_done"] == 3
+    queue.complete(job)
+    done = queue.get(job["id"])
+    assert (done["status"], done["pages_done"]) == ("done", 10)
+    # A finished job is not queued again, nor is its payload rewritten
+    assert queue.enqueue("text", "a.pdf", b"a") == job["id"]
+    assert queue.get(job["id"])["status"] == "done"
+    assert os.listdir(queue.payload_dir) == []
+
+
+def test_stale_job_is_reclaimed(queue):
+    queue.enqueue("text", "a.pdf", b"a")
+    job = queue.claim("worker-1")
+    assert queue.claim("worker-2") is None
+    make_stale(queue, job["id"])
+    reclaimed = queue.claim("worker-2")
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["worker"] == "worker-2"
+    assert reclaimed["attempts"] == 2
+
+
+def test_stale_job_out_of_attempts_fails(queue):
+    queue.enqueue("text", "a.pdf", b"a")
+    job = queue.claim("worker-1")
+    make_stale(queue, job["id"])
+    job = queue.claim("worker-2")
+    make_stale(queue, job["id"])
+    assert queue.claim("worker-3") is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert "2 attempts" in failed["error"]
+    assert os.listdir(queue.payload_dir) == []
+
+
+def test_failed_job_is_retried_until_attempts_run_out(queue):
+    queue.enqueue("text", "a.pdf", b"a")
+    job = queue.claim("worker")
+    queue.fail(job, "ValueError: bad page")
+    assert queue.get(job["id"])["status"] == "queued"
+    job = queue.claim("worker")
+    queue.fail(job, "ValueError: bad page")
+    failed = queue.get(job["id"])
+    assert (failed["status"], failed["error"]) == ("failed", "ValueError: bad page")
+    assert queue.claim("worker") is None
+    # The upload is not kept for a job that will not run again
+    assert os.listdir(queue.payload_dir) == []
+
+
+def test_failed_attempt_waits_before_it_is_retried(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3, retry_seconds=60)
+    queue.enqueue("text", "a.pdf", b"a")
+    queue.enqueue("text", "b.pdf", b"b")
+    queue.fail(queue.claim("worker"), "boom")
+    # The next claim moves on to the other job instead of retrying straight away
+    assert queue.claim("worker")["name"] == "b.pdf"
+    assert queue.claim("worker") is None
+    with queue._lock:
+        queue._conn.execute("UPDATE jobs SET not_before = ? WHERE name = 'a.pdf'", (time.time() - 1,))
+    retried = queue.claim("worker")
+    assert (retried["name"], retried["attempts"]) == ("a.pdf", 2)
+
+
+def test_enqueueing_a_failed_job_starts_it_over(queue):
+    queue.enqueue("text", "a.pdf", b"a")
+    for _ in range(2):
+        queue.fail(queue.claim("worker"), "boom")
+    assert queue.enqueue("text", "a.pdf", b"a") is not None
+    job = queue.claim("worker")
+    assert (job["status"], job["attempts"], job["error"]) == ("running", 1, None)
+    assert queue.payload(job) == b"a"
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+import pytest
+
+from benchmarks.stub_openai import start_server
+from embeddings import GatewayEmbeddings, HashEmbeddings
+from llm_executor import LLMExecutor
+
+MODEL = "gpt-3.5-turbo"
+
+
+@pytest.fixture
+def stub():
+    # stub(**server_options, **executor_options) -> (server state, executor talking to it)
+    servers = []
+
+    def start(latency=0.0, rate_limit_every=0, max_concurrent=0, token_latency=0.0, **executor_options):
+        server, base_url = start_server(latency=latency, rate_limit_every=rate_limit_every,
+                                        max_concurrent=max_concurrent, token_latency=token_latency)
+        servers.append(server)
+        executor = LLMExecutor(
+            client_factory=lambda: openai.OpenAI(api_key="stub", base_url=base_url, max_retries=0),
+            **{"base_delay": 0.01, **executor_options})
+        return server.state, executor
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def chat_request(question):
+    return {"model": MODEL, "messages": [{"role": "user", "content": question}], "temperature": 0}
+
+
+def test_rate_limited_call_is_retried(stub):
+    state, executor = stub(rate_limit_every=2)
+    executor.chat(**chat_request("first question"))
+    completion = executor.chat(**chat_request("second question"))
+    assert completion.choices[0].message.content == "Stub answer: second question"
+    assert state.requests == 3
+    assert state.throttled == 1
+    assert executor.calls[-1]["retries"] == 1
+    assert executor.calls[-1]["error"] is None
+
+
+def test_retries_stop_after_max_retries(stub):
+    state, executor = stub(rate_limit_every=1, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        executor.chat(**chat_request("question"))
+    assert state.requests == 3
+    assert executor.latency_summary()["errors"] == 1
+
+
+def test_identical_concurrent_calls_share_one_request(stub):
+    state, executor = stub(latency=0.3)
+    barrier = threading.Barrier(4)
+
+    def ask(_):
+        barrier.wait()
+        return executor.chat(**chat_request("What was the revenue?")).choices[0].message.content
+
+    with ThreadPoolExecutor(4) as pool:
+        answers = list(pool.map(ask, range(4)))
+    assert answers == ["Stub answer: What was the revenue?"] * 4
+    assert state.paths == {"/v1/chat/completions": 1}
+    assert executor.latency_summary()["coalesced"] == 3
+
+
+def test_map_chat_returns_results_in_request_order(stub):
+    _, executor = stub(latency=0.05)
+    results = executor.map_chat([chat_request(f"document {i}") for i in range(6)])
+    assert [result.choices[0].message.content for result in results] == \
+        [f"Stub answer: document {i}" for i in range(6)]
+
+
+def test_map_chat_returns_failures_instead_of_raising(stub):
+    _, executor = stub(rate_limit_every=1, max_retries=0)
+    results = executor.map_chat([chat_request(f"document {i}") for i in range(3)])
+    assert all(isinstance(result, openai.RateLimitError) for result in results)
+
+
+def test_embeddings_go_through_the_executor(stub):
+    state, executor = stub()
+    texts = ["net revenue", "operating margin", "free cash flow"]
+    vectors = GatewayEmbeddings("text-embedding-ada-002", executor).embed_documents(texts)
+    np.testing.assert_allclose(vectors, HashEmbeddings().embed_documents(texts), rtol=1e-6)
+    assert state.paths == {"/v1/embeddings": 1}
+
+
+def test_stream_yields_the_answer_as_it_arrives(stub):
+    state, executor = stub(token_latency=0.001)
+    text = "".join(executor.stream_chat(**chat_request("What was the revenue?")))
+    assert text == "Stub answer: What was the revenue?"
+    call = executor.calls[-1]
+    assert call["error"] is None
+    assert call["ttft_seconds"] is not None
+    assert call["completion_tokens"] == len(text.split())
+    assert executor.latency_summary()["streams"] == 1
+
+
+def test_abandoned_stream_is_recorded_and_frees_its_slot(stub):
+    _, executor = stub(token_latency=0.001, max_concurrency=1)
+    stream = executor.stream_chat(**chat_request("What was the revenue?"))
+    assert next(stream)
+    stream.close()
+    assert executor.calls[-1]["error"] == "GeneratorExit"
+    # The only slot is free again
+    assert executor.chat(**chat_request("next question")).choices[0].message.content == \
+        "Stub answer: next question"
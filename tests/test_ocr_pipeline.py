@@ -0,0 +1,61 @@
+from io import BytesIO
+
+import fitz
+import pytest
+from PIL import Image
+
+from ocr_pipeline import OCRPipeline, image_coverage, text_layer_usable
+
+PROSE = ("Consolidated revenue for the year was 410 million, an increase of 12 percent over the prior "
+         "year, while operating expenses remained stable and the margin improved to 18 percent.")
+# What a scanner or a later PDF tool stamps onto an image-only page
+STAMP = "CONFIDENTIAL  Acme Corp Annual Report 2023  Page 3 of 12"
+
+
+def test_prose_text_layer_is_used():
+    assert text_layer_usable(PROSE)
+    # A searchable scan: the page is one image, with a full page of recognised text over it
+    assert text_layer_usable(" ".join([PROSE] * 3), coverage=1.0)
+
+
+def test_stamped_scan_goes_to_ocr():
+    # Enough characters for a text page, far too few for a page that is mostly image
+    assert text_layer_usable(STAMP, coverage=0.2)
+    assert not text_layer_usable(STAMP, coverage=0.5)
+    assert not text_layer_usable(STAMP, coverage=0.95)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Page 3",
+    "��� " * 20 + PROSE,
+    "*** --- ||| ... " * 20,
+])
+def test_unusable_text_layers(text):
+    assert not text_layer_usable(text)
+
+
+@pytest.mark.parametrize("width, height, dpi", [
+    (612, 792, 200),     # Letter
+    (595, 842, 190),     # A4, rounded to the nearest 10
+    (792, 612, 200),     # Landscape Letter
+    (200, 300, 400),     # Receipt, capped at max_dpi
+    (2384, 3370, 120),   # A0 poster, raised to min_dpi
+    (0, 0, 200),
+])
+def test_page_dpi_keeps_the_pixel_size_of_a_letter_page(width, height, dpi):
+    assert OCRPipeline(dpi=200).page_dpi(fitz.Rect(0, 0, width, height)) == dpi
+
+
+def test_image_coverage():
+    png = BytesIO()
+    Image.new("RGB", (20, 20), "gray").save(png, format="PNG")
+    with fitz.open() as doc:
+        blank = doc.new_page(width=612, height=792)
+        assert image_coverage(blank) == 0.0
+        scan = doc.new_page(width=612, height=792)
+        scan.insert_image(scan.rect, stream=png.getvalue(), keep_proportion=False)
+        assert image_coverage(scan) == pytest.approx(1.0)
+        logo = doc.new_page(width=612, height=792)
+        logo.insert_image(fitz.Rect(0, 0, 306, 396), stream=png.getvalue(), keep_proportion=False)
+        assert image_coverage(logo) == pytest.approx(0.25)
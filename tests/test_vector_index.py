@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from brain_text import text_to_docs
+from embeddings import HashEmbeddings
+from index_store import IndexStore
+from lexical_index import reciprocal_rank_fusion
+from vector_index import DocumentIndex, IVFBackend, SQ8Backend
+
+PAGES = {
+    "annual": ["Net revenue grew to 410 million on strong subscription sales.",
+               "Operating margin improved to 18 percent after the restructuring.",
+               "The goodwill impairment recorded for the Zephyr-7 segment was 12.5 million."],
+    "interim": ["Free cash flow covered the dividend twice in the first half.",
+                "Net revenue for the half year was 198 million."],
+}
+
+
+@pytest.fixture(params=["mmap", "flat"])
+def index(request):
+    embedder = HashEmbeddings()
+    index = DocumentIndex(embedder, backend=request.param)
+    for doc_id, pages in PAGES.items():
+        docs = text_to_docs(pages, f"{doc_id}.pdf", doc_id)
+        index.add_document(doc_id, f"{doc_id}.pdf", docs, embedder.embed_documents([doc.page_content for doc in docs]))
+    return index
+
+
+def test_add_document_once_per_doc_id(index):
+    docs = text_to_docs(["Another page."], "annual.pdf", "annual")
+    assert not index.add_document("annual", "annual.pdf", docs, index.embedder.embed_documents(["Another page."]))
+    assert index.document_names() == ["annual.pdf", "interim.pdf"]
+    assert "annual" in index and len(index) == 2
+
+
+def test_search_returns_each_documents_best_chunks(index):
+    results = index.search("What was the free cash flow?", k=1)
+    assert set(results) == {"annual", "interim"}
+    assert "Free cash flow" in results["interim"][0].page_content
+    assert all(len(docs) == 1 for docs in results.values())
+    assert results["interim"][0].metadata["filename"] == "interim.pdf"
+
+
+def test_removed_document_is_no_longer_searched(index):
+    before = index.fingerprint()
+    assert index.remove_document("interim")
+    assert not index.remove_document("interim")
+    assert index.fingerprint() != before
+    assert set(index.search("free cash flow dividend", k=3)) == {"annual"}
+    assert set(index.lexical_search("free cash flow dividend", k=3)) == {"annual"}
+    assert index.search("free cash flow dividend", k=10, per_document=False)[0].metadata["doc_id"] == "annual"
+
+
+def test_lexical_search_finds_exact_identifiers(index):
+    hits = index.lexical_search("Zephyr-7 goodwill impairment", k=1)
+    assert "Zephyr-7" in hits["annual"][0].page_content
+    assert hits["interim"] == []
+
+
+def test_hybrid_search_fuses_vector_and_lexical_rankings(index):
+    question = "What was the goodwill impairment for Zephyr-7?"
+    query_vector = index.embedder.embed_query(question)
+    hybrid = index.hybrid_search(question, k=3, query_vector=query_vector, mode="hybrid")
+    vector = index.search(question, k=3, query_vector=query_vector)
+    lexical = index.lexical_search(question, k=3)
+
+    expected = reciprocal_rank_fusion(
+        [[(doc.metadata["chunk_id"], doc) for doc in ranking["annual"]] for ranking in (vector, lexical)], 3)
+    assert [(doc.metadata["chunk_id"], score) for doc, score in hybrid["annual"]] == \
+        [(doc.metadata["chunk_id"], score) for doc, score in expected]
+    assert "Zephyr-7" in hybrid["annual"][0][0].page_content
+
+
+def test_hybrid_search_without_a_vector_is_lexical(index):
+    hits = index.hybrid_search("Zephyr-7 goodwill", k=3, query_vector=None, mode="hybrid")
+    assert [doc.metadata["chunk_id"] for doc, _ in hits["annual"]] == \
+        [doc.metadata["chunk_id"] for doc in index.lexical_search("Zephyr-7 goodwill", k=3)["annual"]]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[("a", "A"), ("b", "B"), ("c", "C")], [("b", "B"), ("d", "D")]], k=2, rrf_k=60)
+    assert [item for item, _ in fused] == ["B", "A"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+@pytest.mark.parametrize("backend_class", [SQ8Backend, IVFBackend])
+def test_trained_quantizer_is_reused_by_the_next_session(tmp_path, monkeypatch, backend_class):
+    vectors = np.random.default_rng(0).normal(size=(400, 16)).astype("float32")
+    ids = np.arange(400, dtype="int64")
+    store = IndexStore(str(tmp_path))
+    first = backend_class(16, train_size=400, store=store, embedding="hash-16")
+    first.add(ids, vectors)
+    assert first.index is not None
+
+    monkeypatch.setattr(backend_class, "build", lambda self, count: pytest.fail("trained again"))
+    second = backend_class(16, train_size=400, store=store, embedding="hash-16")
+    second.add(ids, vectors)
+    np.testing.assert_array_equal(second.search(vectors[:5], 3)[1], first.search(vectors[:5], 3)[1])
+    # Other settings do not pick up the stored quantizer
+    assert store.load_trained(backend_class(16, train_size=400, embedding="hash-32").settings()) is None
@@ -0,0 +1,90 @@
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+TOKEN_ENCODING = os.environ.get("TOKEN_ENCODING", "cl100k_base")
+
+# Stand-in token boundaries (a word or a punctuation mark, with its leading whitespace)
+# used when tiktoken cannot download its vocabulary, e.g. on an offline host
+_APPROXIMATE_TOKEN = re.compile(r"\s*(?:\w+|[^\w\s])|\s+$")
+# The same boundaries for ASCII text (extracted pages always are), matched about a third
+# faster under re.ASCII; Unicode also counts \x1c-\x1f as whitespace
+_ASCII_SPACE = r"[\s\x1c-\x1f]"
+_APPROXIMATE_ASCII_TOKEN = re.compile(rf"{_ASCII_SPACE}*(?:\w+|[^\w\s\x1c-\x1f])|{_ASCII_SPACE}+$", re.ASCII)
+
+
+def _approximate_token(text):
+    return _APPROXIMATE_ASCII_TOKEN if text.isascii() else _APPROXIMATE_TOKEN
+
+
+@lru_cache(maxsize=None)
+def _approximate_run(tokens, ascii):
+    # Exactly `tokens` approximate tokens, trailing whitespace excluded; the lookahead keeps
+    # the repetition from splitting a word to make up the count
+    if ascii:
+        return re.compile(rf"(?:{_ASCII_SPACE}*(?:\w+(?!\w)|[^\w\s\x1c-\x1f])){{{tokens}}}", re.ASCII)
+    return re.compile(rf"(?:\s*(?:\w+(?!\w)|[^\w\s])){{{tokens}}}")
+
+_encoding = None
+
+
+def get_encoding():
+    # Returns the tiktoken encoding, or None when it is unavailable
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return sum(1 for _ in _approximate_token(text).finditer(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class _ApproximateOffsets:
+    # The start offsets of the approximate tokens. Runs of `stride` tokens are matched in C, so
+    # only every stride-th offset is stored; the rest are found by matching forward from one
+    def __init__(self, text, stride):
+        self.text = text
+        self.stride = stride
+        self.ascii = text.isascii()
+        runs = _approximate_run(stride, self.ascii).findall(text)
+        self.starts = [0, *accumulate(map(len, runs))]
+        self.count = stride * len(runs) + sum(1 for _ in _approximate_token(text).finditer(text, self.starts[-1]))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        run, within = divmod(i, self.stride)
+        if not within:
+            return self.starts[run]
+        return _approximate_run(within, self.ascii).match(self.text, self.starts[run]).end()
+
+
+def token_offsets(text, stride=1):
+    # Character offset at which each token of text starts. Callers reading mostly every
+    # stride-th offset pass stride so the approximate tokenizer can skip the ones between
+    encoding = get_encoding()
+    if encoding is None:
+        if stride == 1:
+            return [0, *accumulate(map(len, _approximate_token(text).findall(text)))][:-1]
+        return _ApproximateOffsets(text, stride)
+    # Byte lengths are summed in C; only non-ASCII text needs mapping back to characters
+    token_bytes = encoding.decode_tokens_bytes(encoding.encode_ordinary(text))
+    starts = [0, *accumulate(map(len, token_bytes))][:-1]
+    if text.isascii():
+        return starts
+    char_ends = list(accumulate(len(char.encode("utf-8")) for char in text))
+    return [bisect_right(char_ends, start) for start in starts]
@@ -0,0 +1,255 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1") != "0"
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", 2000))
+TRACE_FILE = os.environ.get("TRACE_FILE")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+# /spans exposes document filenames; bind 0.0.0.0 only where the port is not publicly reachable
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    # Attributes ending in "_tokens" are summed per stage; cache_hits and cache_misses
+    # feed the cache counters
+    __slots__ = ("tracer", "id", "parent", "trace", "name", "attributes", "started", "seconds", "error",
+                 "_start", "_token")
+
+    def __init__(self, tracer, span_id, name, attributes):
+        self.tracer = tracer
+        self.id = span_id
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.trace = span_id
+        self.seconds = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self.parent, self.trace = parent.id, parent.trace
+        self._token = _current.set(self)
+        self.started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace": self.trace,
+            "span": self.id,
+            "parent": self.parent,
+            "name": self.name,
+            "started": self.started,
+            "seconds": self.seconds,
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class _NoopSpan:
+    # Handed out when tracing is off, so instrumented code pays for one call and nothing else
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled=TRACING_ENABLED, max_spans=TRACE_MAX_SPANS, path=TRACE_FILE):
+        self.enabled = enabled
+        self.path = path
+        self.spans = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, next(self._ids), name, attributes)
+
+    def _finish(self, span):
+        record = span.to_dict()
+        with self._lock:
+            self.spans.append(record)
+            totals = self._totals.setdefault(span.name, {
+                "count": 0, "seconds": 0.0, "errors": 0, "cache_hits": 0, "cache_misses": 0, "tokens": {},
+                "timings": {},
+            })
+            totals["count"] += 1
+            totals["seconds"] += span.seconds
+            totals["errors"] += span.error is not None
+            for key, value in span.attributes.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if key in ("cache_hits", "cache_misses"):
+                    totals[key] += value
+                elif key.endswith("_tokens"):
+                    kind = key[:-len("_tokens")]
+                    totals["tokens"][kind] = totals["tokens"].get(kind, 0) + value
+                elif key.endswith("_seconds"):
+                    # Durations inside a span, e.g. time to first token; reported as a mean
+                    count, total = totals["timings"].get(key, (0, 0.0))
+                    totals["timings"][key] = (count + 1, total + value)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def recent(self, limit=None):
+        with self._lock:
+            spans = list(self.spans)
+        return spans[-limit:] if limit else spans
+
+    def last_trace(self, name):
+        # Every span of the most recent finished trace whose root is called name
+        spans = self.recent()
+        for span in reversed(spans):
+            if span["parent"] is None and span["name"] == name:
+                return [other for other in spans if other["trace"] == span["trace"]]
+        return []
+
+    def summary(self, precision=4):
+        with self._lock:
+            totals = {name: dict(values, tokens=dict(values["tokens"]), timings=dict(values["timings"]))
+                      for name, values in self._totals.items()}
+        rows = []
+        for name, values in sorted(totals.items()):
+            row = {
+                "stage": name,
+                "count": values["count"],
+                "seconds": round(values["seconds"], precision),
+                "mean_seconds": round(values["seconds"] / values["count"], precision),
+                "errors": values["errors"],
+                "cache_hits": values["cache_hits"],
+                "cache_misses": values["cache_misses"],
+            }
+            row.update({f"{kind}_tokens": count for kind, count in sorted(values["tokens"].items())})
+            row.update({f"mean_{key}": round(total / count, precision)
+                        for key, (count, total) in sorted(values["timings"].items())})
+            rows.append(row)
+        return rows
+
+    def to_jsonl(self):
+        return "".join(json.dumps(span, default=str) + "\n" for span in self.recent())
+
+    def prometheus_text(self):
+        rows = self.summary(precision=9)
+        lines = [
+            "# HELP rag_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE rag_stage_seconds summary",
+        ]
+        for row in rows:
+            lines.append(f'rag_stage_seconds_count{{stage="{row["stage"]}"}} {row["count"]}')
+            lines.append(f'rag_stage_seconds_sum{{stage="{row["stage"]}"}} {row["seconds"]}')
+        lines += ["# HELP rag_stage_errors_total Stage runs that raised.", "# TYPE rag_stage_errors_total counter"]
+        lines += [f'rag_stage_errors_total{{stage="{row["stage"]}"}} {row["errors"]}' for row in rows]
+        lines += ["# HELP rag_stage_tokens_total Tokens handled per stage.", "# TYPE rag_stage_tokens_total counter"]
+        for row in rows:
+            for key, value in row.items():
+                if key.endswith("_tokens"):
+                    kind = key[:-len("_tokens")]
+                    lines.append(f'rag_stage_tokens_total{{stage="{row["stage"]}",kind="{kind}"}} {value}')
+        lines += ["# HELP rag_cache_requests_total Cache lookups per stage.", "# TYPE rag_cache_requests_total counter"]
+        for row in rows:
+            if row["cache_hits"] or row["cache_misses"]:
+                lines.append(f'rag_cache_requests_total{{stage="{row["stage"]}",result="hit"}} {row["cache_hits"]}')
+                lines.append(f'rag_cache_requests_total{{stage="{row["stage"]}",result="miss"}} {row["cache_misses"]}')
+        return "\n".join(lines) + "\n"
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+    return _tracer
+
+
+def span(name, **attributes):
+    return get_tracer().span(name, **attributes)
+
+
+def current_span():
+    # The innermost open span, for adding attributes from deeper in the call stack
+    return _current.get() or NOOP_SPAN
+
+
+def traced(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _metrics_handler(tracer):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = tracer.prometheus_text(), "text/plain; version=0.0.4"
+            elif self.path == "/spans":
+                body, content_type = tracer.to_jsonl(), "application/x-ndjson"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    # Serves /metrics (Prometheus text) and /spans (JSON lines); Streamlit reruns reuse the first server
+    global _metrics_server
+    tracer = get_tracer()
+    with _tracer_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _metrics_handler(tracer))
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
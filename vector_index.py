@@ -0,0 +1,365 @@
+import hashlib
+import math
+import os
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+
+import faiss
+import numpy as np
+
+from index_store import get_index_store
+from lexical_index import LexicalIndex, build_postings, reciprocal_rank_fusion
+
+# "mmap" keeps stored vectors memory-mapped; "flat" copies them into a FAISS index; "fp16" halves
+# that; "sq8", "ivf" and "ivfpq" switch from exact search to a trained index once there is enough data
+INDEX_BACKEND = os.environ.get("INDEX_BACKEND", "mmap")
+# Vectors needed before a trained backend trains; until then it searches exactly
+INDEX_TRAIN_MIN = int(os.environ.get("INDEX_TRAIN_MIN", 10000))
+# IVF lists (0 picks about 4 * sqrt(n)), lists probed per query, and PQ sub-quantizers (0 picks d / 8)
+INDEX_NLIST = int(os.environ.get("INDEX_NLIST", 0))
+INDEX_NPROBE = int(os.environ.get("INDEX_NPROBE", 16))
+INDEX_PQ_M = int(os.environ.get("INDEX_PQ_M", 0))
+# "hybrid" fuses vector and BM25 rankings; "vector" and "lexical" use one of them. Without a
+# question vector (embedding service down or slow) every mode answers from BM25 alone
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+
+
+class FlatBackend:
+    # Exact L2 search, the same metric FAISS.from_documents used
+    def __init__(self, dimensions):
+        self.index = faiss.IndexIDMap2(self.build(dimensions))
+
+    def build(self, dimensions):
+        return faiss.IndexFlatL2(dimensions)
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    def add(self, ids, vectors):
+        self.index.add_with_ids(vectors, ids)
+
+    def remove(self, start, end):
+        self.index.remove_ids(faiss.IDSelectorRange(start, end))
+
+    def search(self, queries, k, id_range=None):
+        params = None
+        if id_range is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorRange(*id_range))
+        return self.index.search(queries, k, params=params)
+
+
+class Float16Backend(FlatBackend):
+    # Half-precision copies of the vectors; no training, near-exact distances
+    def build(self, dimensions):
+        return faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_fp16)
+
+
+class TrainedBackend(ABC):
+    # Searches exactly until train_size vectors have been added, then trains the compressed
+    # index on all of them and moves them over; later documents go straight into it.
+    # With a store, the trained quantizer is saved under the backend settings and embedding
+    # model, and later sessions load it instead of training again. It is reused for any set
+    # of documents; delete the store's "trained" directory to train on the current corpus.
+    min_train_size = 1
+
+    def __init__(self, dimensions, train_size=INDEX_TRAIN_MIN, nlist=INDEX_NLIST, nprobe=INDEX_NPROBE,
+                 store=None, embedding=None):
+        self.dimensions = dimensions
+        self.train_size = max(train_size, self.min_train_size)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.store = store
+        self.embedding = embedding
+        self.exact = FlatBackend(dimensions)
+        self.index = None
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal if self.index is not None else self.exact.ntotal
+
+    @abstractmethod
+    def build(self, count):
+        # The untrained FAISS index for count training vectors
+        ...
+
+    def _lists(self, count):
+        # Around 4 * sqrt(n) lists, with the 39 training points per centroid k-means asks for
+        nlist = self.nlist or int(4 * math.sqrt(count))
+        return max(1, min(nlist, count // 39))
+
+    def settings(self):
+        # Everything that shapes the trained quantizer
+        return {"backend": type(self).__name__, "dimensions": self.dimensions, "train_size": self.train_size,
+                "nlist": self.nlist, "embedding": self.embedding}
+
+    def _train(self):
+        vectors = self.exact.index.index.reconstruct_n(0, self.exact.ntotal)
+        ids = faiss.vector_to_array(self.exact.index.id_map)
+        index = self.store.load_trained(self.settings()) if self.store is not None else None
+        if index is None:
+            index = self.build(len(vectors))
+            index.train(vectors)
+            if self.store is not None:
+                # Saved before any vectors go in, so only the quantizer is stored
+                self.store.save_trained(self.settings(), index)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        self.exact = None
+
+    def add(self, ids, vectors):
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+        self.exact.add(ids, vectors)
+        if self.exact.ntotal >= self.train_size:
+            self._train()
+
+    def remove(self, start, end):
+        if self.index is None:
+            self.exact.remove(start, end)
+        else:
+            self.index.remove_ids(faiss.IDSelectorRange(start, end))
+
+    def search_parameters(self, selector):
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, queries, k, id_range=None):
+        if self.index is None:
+            return self.exact.search(queries, k, id_range)
+        selector = faiss.IDSelectorRange(*id_range) if id_range is not None else None
+        return self.index.search(queries, k, params=self.search_parameters(selector))
+
+
+class SQ8Backend(TrainedBackend):
+    # One byte per dimension; training only learns each dimension's range
+    def build(self, count):
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(self.dimensions, faiss.ScalarQuantizer.QT_8bit))
+
+
+class IVFBackend(TrainedBackend):
+    # Full vectors bucketed by a coarse quantizer; each query scans only nprobe buckets
+    def build(self, count):
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(self.dimensions), self.dimensions, self._lists(count))
+
+    def search_parameters(self, selector):
+        # Filling a single document's results scans every list so small documents are not missed
+        nprobe = self.index.nlist if selector is not None else min(self.nprobe, self.index.nlist)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+
+
+class IVFPQBackend(IVFBackend):
+    # IVF over product-quantized codes: m bytes per vector instead of 4 * d
+    min_train_size = 39 * 256
+
+    def __init__(self, dimensions, pq_m=INDEX_PQ_M, **kwargs):
+        super().__init__(dimensions, **kwargs)
+        self.pq_m = pq_m or self._default_m(dimensions)
+
+    @staticmethod
+    def _default_m(dimensions):
+        # The largest divisor of d that is at most d / 8
+        return max(m for m in range(1, max(1, dimensions // 8) + 1) if dimensions % m == 0)
+
+    def settings(self):
+        return {**super().settings(), "pq_m": self.pq_m}
+
+    def build(self, count):
+        quantizer = faiss.IndexFlatL2(self.dimensions)
+        return faiss.IndexIVFPQ(quantizer, self.dimensions, self._lists(count), self.pq_m, 8)
+
+
+class MmapFlatBackend:
+    # Exact L2 over per-document arrays that stay memory-mapped, so every process
+    # that loads the same stored documents shares one copy in the OS page cache
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self._segments = []
+
+    @property
+    def ntotal(self):
+        return sum(len(vectors) for _, vectors, _ in self._segments)
+
+    def add(self, ids, vectors):
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        self._segments.append((int(ids[0]), vectors, norms))
+
+    def remove(self, start, end):
+        self._segments = [segment for segment in self._segments if not start <= segment[0] < end]
+
+    def search(self, queries, k, id_range=None):
+        all_distances = np.full((len(queries), k), np.inf, dtype="float32")
+        all_ids = np.full((len(queries), k), -1, dtype="int64")
+        for row, query in enumerate(queries):
+            distances, ids = [], []
+            for start, vectors, norms in self._segments:
+                if id_range is not None and not id_range[0] <= start < id_range[1]:
+                    continue
+                segment_distances = norms - 2 * (vectors @ query) + query @ query
+                take = min(k, len(segment_distances))
+                top = np.argpartition(segment_distances, take - 1)[:take]
+                distances.append(segment_distances[top])
+                ids.append(top + start)
+            if not distances:
+                continue
+            distances = np.concatenate(distances)
+            ids = np.concatenate(ids)
+            order = np.argsort(distances)[:k]
+            all_distances[row, :len(order)] = distances[order]
+            all_ids[row, :len(order)] = ids[order]
+        return all_distances, all_ids
+
+
+BACKENDS = {
+    "flat": FlatBackend,
+    "mmap": MmapFlatBackend,
+    "fp16": Float16Backend,
+    "sq8": SQ8Backend,
+    "ivf": IVFBackend,
+    "ivfpq": IVFPQBackend,
+}
+
+
+class DocumentIndex:
+    # One vector index shared by every uploaded document. Each document owns a
+    # contiguous id range, so it can be searched, filtered or dropped on its own.
+    def __init__(self, embedder, backend=INDEX_BACKEND, store=None):
+        self.embedder = embedder
+        self.backend_factory = BACKENDS[backend]
+        self.store = store
+        self.lexical = LexicalIndex()
+        self.documents = {}
+        self._chunks = {}
+        self._vectors = {}
+        self._next_id = 0
+        self._backend = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def document_names(self):
+        return [entry["filename"] for entry in self.documents.values()]
+
+    def fingerprint(self):
+        # Identifies the exact set of indexed documents, independent of upload order
+        return hashlib.sha256("\n".join(sorted(self.documents)).encode("utf-8")).hexdigest()
+
+    def add_document(self, doc_id, filename, docs, vectors, postings=None):
+        if doc_id in self.documents:
+            return False
+        if postings is None:
+            postings = build_postings(doc.page_content for doc in docs)
+        self.lexical.add(doc_id, postings)
+        start = self._next_id
+        end = start + len(docs)
+        if docs:
+            vectors = np.asarray(vectors, dtype="float32")
+            if self._backend is None:
+                self._backend = self._new_backend(vectors.shape[1])
+            self._backend.add(np.arange(start, end, dtype="int64"), vectors)
+        self._chunks[doc_id] = docs
+        self._vectors[doc_id] = vectors
+        self.documents[doc_id] = {"filename": filename, "start": start, "end": end}
+        self._next_id = end
+        return True
+
+    def _new_backend(self, dimensions):
+        if not issubclass(self.backend_factory, TrainedBackend):
+            return self.backend_factory(dimensions)
+        return self.backend_factory(dimensions, store=self.store or get_index_store(), embedding=self.embedder.model)
+
+    def remove_document(self, doc_id):
+        entry = self.documents.pop(doc_id, None)
+        if entry is None:
+            return False
+        if entry["end"] > entry["start"]:
+            self._backend.remove(entry["start"], entry["end"])
+        self.lexical.remove(doc_id)
+        del self._chunks[doc_id]
+        del self._vectors[doc_id]
+        return True
+
+    def _chunk(self, doc_id, chunk_id):
+        doc = self._chunks[doc_id][chunk_id - self.documents[doc_id]["start"]]
+        doc.metadata["doc_id"] = doc_id
+        doc.metadata["chunk_id"] = chunk_id
+        return doc
+
+    def chunk_vectors(self, docs):
+        # Stored vectors for Documents returned by search, in the same order
+        rows = []
+        for doc in docs:
+            doc_id = doc.metadata["doc_id"]
+            rows.append(self._vectors[doc_id][doc.metadata["chunk_id"] - self.documents[doc_id]["start"]])
+        return np.asarray(rows, dtype="float32")
+
+    def _owners(self):
+        ordered = sorted(self.documents.items(), key=lambda item: item[1]["start"])
+        starts = [entry["start"] for _, entry in ordered]
+        doc_ids = [doc_id for doc_id, _ in ordered]
+
+        def owner(chunk_id):
+            position = bisect_right(starts, chunk_id) - 1
+            return doc_ids[position] if position >= 0 else None
+
+        return owner
+
+    def search(self, question, k=10, per_document=True, query_vector=None):
+        # Per document: {doc_id: [Document, ...]} in upload order. Global: [Document, ...]
+        # Pass query_vector when the caller already embedded the question.
+        if per_document:
+            results = {doc_id: [] for doc_id in self.documents}
+        else:
+            results = []
+        if self._backend is None or self._backend.ntotal == 0:
+            return results
+
+        if query_vector is None:
+            query_vector = self.embedder.embed_query(question)
+        query = np.asarray([query_vector], dtype="float32")
+        owner = self._owners()
+        if not per_document:
+            _, ids = self._backend.search(query, min(k, self._backend.ntotal))
+            return [self._chunk(owner(int(i)), int(i)) for i in ids[0] if i >= 0]
+
+        # One over-fetched search usually covers every document; only documents that
+        # came back short get a follow-up search restricted to their own id range
+        fetch = min(self._backend.ntotal, k * len(self.documents) * 2)
+        _, ids = self._backend.search(query, fetch)
+        for chunk_id in ids[0]:
+            if chunk_id < 0:
+                continue
+            doc_id = owner(int(chunk_id))
+            if doc_id in results and len(results[doc_id]) < k:
+                results[doc_id].append(self._chunk(doc_id, int(chunk_id)))
+
+        for doc_id, entry in self.documents.items():
+            size = entry["end"] - entry["start"]
+            if len(results[doc_id]) < min(k, size):
+                _, ids = self._backend.search(query, min(k, size), id_range=(entry["start"], entry["end"]))
+                results[doc_id] = [self._chunk(doc_id, int(i)) for i in ids[0] if i >= 0]
+        return results
+
+    def lexical_search(self, question, k=10):
+        # Per document: [Document, ...] ranked by BM25; no embedding needed
+        return {
+            doc_id: [self._chunk(doc_id, self.documents[doc_id]["start"] + offset) for offset, _ in hits]
+            for doc_id, hits in self.lexical.search(question, k).items()
+        }
+
+    def hybrid_search(self, question, k=10, query_vector=None, mode=RETRIEVAL_MODE):
+        # Per document: [(Document, fused score)], best first. Vector and BM25 rankings are
+        # merged by reciprocal rank fusion; without query_vector only BM25 is used
+        rankings = []
+        if mode != "lexical" and query_vector is not None:
+            rankings.append(self.search(question, k, query_vector=query_vector))
+        if mode != "vector" or query_vector is None:
+            rankings.append(self.lexical_search(question, k))
+        return {
+            doc_id: reciprocal_rank_fusion(
+                [[(doc.metadata["chunk_id"], doc) for doc in ranking[doc_id]] for ranking in rankings], k)
+            for doc_id in self.documents
+        }